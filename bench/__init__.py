@@ -0,0 +1 @@
+"""Benchmarks for the neovim_gui package."""
@@ -0,0 +1,154 @@
+"""Replay redraw traces through UIBridge, Screen and GtkUI without a display.
+
+The UI draws into cairo image surfaces instead of a window, so neither a
+display server nor a nvim process is needed. Run from the repository root:
+
+    python -m bench.redraw [--trace NAME] [--columns N] [--rows N]
+    python -m bench.redraw --file TRACE_FILE
+
+A file recorded with `pynvim --record` can be replayed instead of the
+generated traces.
+
+For each trace this reports redraw events per second, frames (a redraw
+batch applied and painted) per second, the time spent in each handler and the
+time spent preparing updates, which happens in the nvim event loop.
+"""
+import argparse
+import time
+from functools import partial
+
+import cairo
+
+from neovim_gui.gtk_ui import GtkUI
+from neovim_gui.trace import read_trace
+from neovim_gui.ui_bridge import UIBridge
+
+from .traces import TRACES
+
+
+class _Null(object):
+
+    """Stand-in for nvim and Gtk objects, ignores everything."""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return None
+
+
+class HeadlessUI(GtkUI):
+
+    """GtkUI that draws to image surfaces and never creates a window."""
+
+    def __init__(self, columns, rows, font=('Monospace', 13)):
+        """Initialize the UI instance."""
+        super(HeadlessUI, self).__init__(font, max_fps=0)
+        self._columns = columns
+        self._rows = rows
+
+    def start(self, bridge):
+        """Attach without starting the Gtk event loop."""
+        self._window = _Null()
+        self._drawing_area = _Null()
+        self._im_context = _Null()
+        self._bridge = bridge
+        bridge.attach(self._columns, self._rows, rgb=True,
+                      ext_linegrid=True)
+
+    def _create_surface(self, width, height):
+        return cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+
+
+def _time_handlers(bridge, timings):
+    # wrap every dispatch table entry to accumulate calls and time per event
+    def timed(name, handler, *args):
+        start = time.time()
+        handler(*args)
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.time() - start
+    for name, (handler, nparam) in list(bridge._dispatch.items()):
+        bridge._dispatch[name] = (partial(timed, name, handler), nparam)
+
+
+def _count_events(batches):
+    return sum(len(update) - 1 for batch in batches for update in batch)
+
+
+def load(path):
+    """Load the redraw batches of a recorded trace file."""
+    return [args for _, method, args in read_trace(path)
+            if method == 'redraw']
+
+
+def run(name, columns, rows, batches):
+    """Replay a trace and return its measurements."""
+    ui = HeadlessUI(columns, rows)
+    bridge = UIBridge()
+    bridge._nvim = _Null()
+    bridge._ui = ui
+    bridge.debug_events = bridge.debug_ext = False
+    bridge._build_dispatch()
+    ui.start(bridge)
+    timings = {}
+    _time_handlers(bridge, timings)
+    # done in the nvim event loop, so it is measured separately
+    start = time.time()
+    prepared = [bridge._prepare_updates(batch) for batch in batches]
+    prepare_time = time.time() - start
+    window = None
+    start = time.time()
+    for batch in prepared:
+        ui._updates.append(partial(bridge._apply_updates, batch))
+        ui._drain_updates()
+        if window is None:
+            window = cairo.ImageSurface(cairo.FORMAT_RGB24, ui._pixel_width,
+                                        ui._pixel_height)
+        ui._gtk_draw(None, cairo.Context(window))
+    elapsed = time.time() - start
+    return {
+        'trace': name,
+        'events': _count_events(batches),
+        'frames': len(batches),
+        'elapsed': elapsed,
+        'prepare': prepare_time,
+        'handlers': timings,
+    }
+
+
+def report(result):
+    """Print the measurements of a trace."""
+    elapsed = result['elapsed']
+    print('{0}: {1} events, {2} frames in {3:.3f}s'.format(
+        result['trace'], result['events'], result['frames'], elapsed))
+    print('  {0:.0f} events/s, {1:.1f} frames/s'.format(
+        result['events'] / elapsed, result['frames'] / elapsed))
+    print('  {0:.3f}s preparing updates in the nvim thread'.format(
+        result['prepare']))
+    handlers = sorted(result['handlers'].items(), key=lambda i: -i[1][1])
+    for name, (calls, total) in handlers:
+        print('  {0:<20} {1:8} calls {2:10.3f}ms {3:8.1f}us/call'.format(
+            name, calls, total * 1000, total / calls * 1e6))
+
+
+def main():
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--trace', choices=sorted(TRACES), action='append')
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--file', action='append', default=[])
+    args = parser.parse_args()
+    for path in args.file:
+        report(run(path, args.columns, args.rows, load(path)))
+    if args.file and not args.trace:
+        return
+    for name in args.trace or sorted(TRACES):
+        batches = TRACES[name](args.columns, args.rows, args.frames)
+        report(run(name, args.columns, args.rows, batches))
+
+
+if __name__ == '__main__':
+    main()
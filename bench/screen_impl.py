@@ -0,0 +1,108 @@
+"""Compare the compiled and pure python Screen implementations.
+
+Build the extension first with `python setup.py build_ext --inplace`, then
+run from the repository root with `python -m bench.screen_impl`.
+
+The redraw traces are applied to both implementations and the contents of
+every row are compared after each batch. Any difference is reported and
+aborts the comparison, otherwise the time taken by each implementation is
+printed.
+"""
+import argparse
+import os
+import time
+from importlib.util import module_from_spec, spec_from_file_location
+
+import neovim_gui.screen
+
+from .traces import TRACES
+
+
+def _pure_module():
+    path = os.path.join(os.path.dirname(neovim_gui.screen.__file__),
+                        'screen.py')
+    spec = spec_from_file_location('neovim_gui._pure_screen', path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def apply_batch(screen_class, screen, batch):
+    """Apply the updates of a redraw batch to a screen.
+
+    Only the updates of the default grid are applied.
+    """
+    for update in batch:
+        name = update[0]
+        for args in update[1:]:
+            if not name.startswith('grid_') or args[0] != 1:
+                continue
+            if name == 'grid_resize':
+                if screen is None:
+                    screen = screen_class(args[1], args[2])
+                else:
+                    screen.resize(args[1], args[2])
+            elif name == 'grid_line':
+                screen.put_line(args[1], args[2], args[3])
+            elif name == 'grid_scroll':
+                _, top, bot, left, right, rows, _ = args
+                screen.set_scroll_region(top, bot - 1, left, right - 1)
+                screen.scroll(rows)
+                screen.set_scroll_region(0, screen.rows - 1, 0,
+                                         screen.columns - 1)
+            elif name == 'grid_clear':
+                screen.clear()
+            elif name == 'grid_cursor_goto':
+                screen.cursor_goto(args[1], args[2])
+    return screen
+
+
+def contents(screen):
+    """Get the runs of every row and the cursor position of a screen."""
+    return (list(screen.iter(0, screen.rows - 1, 0, screen.columns - 1)),
+            screen.get_cursor(), (screen.row, screen.col,))
+
+
+def check_parity(compiled, pure, batches):
+    """Apply batches to both implementations, comparing after each one."""
+    a = b = None
+    for i, batch in enumerate(batches):
+        a = apply_batch(compiled, a, batch)
+        b = apply_batch(pure, b, batch)
+        if contents(a) != contents(b):
+            raise AssertionError('screens differ after batch {0}'.format(i))
+
+
+def time_screen(screen_class, batches):
+    """Time applying the batches and iterating over the whole screen."""
+    start = time.time()
+    screen = None
+    for batch in batches:
+        screen = apply_batch(screen_class, screen, batch)
+        for _ in screen.iter(0, screen.rows - 1, 0, screen.columns - 1):
+            pass
+    return time.time() - start
+
+
+def main():
+    """Run the comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+    compiled = neovim_gui.screen.Screen
+    pure = _pure_module().Screen
+    if neovim_gui.screen.__file__.endswith('.py'):
+        print('neovim_gui.screen is not compiled, comparing it with itself')
+    for name in sorted(TRACES):
+        batches = TRACES[name](args.columns, args.rows, args.frames)
+        check_parity(compiled, pure, batches)
+        t_compiled = time_screen(compiled, batches)
+        t_pure = time_screen(pure, batches)
+        print('{0:<8} compiled {1:8.3f}s  pure {2:8.3f}s  {3:5.1f}x'.format(
+            name, t_compiled, t_pure, t_pure / t_compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark Screen.scroll on a 250x80 grid.
+
+Run from the repository root with `python -m bench.screen_scroll`.
+
+The baseline is the Screen of the initial commit, which stored a Cell
+object per cell and scrolled by copying them one by one. Its source is read
+from git, so the repository history must be available.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import timeit
+from importlib.util import module_from_spec, spec_from_file_location
+
+from neovim_gui.screen import Screen
+
+
+COLUMNS, ROWS = 250, 80
+BASELINE_COMMIT = 'b287038'
+
+
+def _baseline_module():
+    source = subprocess.check_output(
+        ['git', 'show', BASELINE_COMMIT + ':neovim_gui/screen.py'],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'screen.py')
+        with open(path, 'wb') as f:
+            f.write(source)
+        spec = spec_from_file_location('neovim_gui._baseline_screen', path)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        shutil.rmtree(directory)
+    return module
+
+
+def _filled_screen(screen_class):
+    screen = screen_class(COLUMNS, ROWS)
+    for row in range(ROWS):
+        screen.cursor_goto(row, 0)
+        for col in range(COLUMNS):
+            screen.put(chr(ord('a') + (row + col) % 26), row % 7)
+    return screen
+
+
+def _bench(name, screen, number=2000):
+    def run():
+        screen.scroll(1)
+        screen.scroll(-1)
+    elapsed = min(timeit.repeat(run, number=number, repeat=3))
+    usec = elapsed / (number * 2) * 1e6
+    print('{0:<36} {1:10.2f} us/scroll'.format(name, usec))
+    return usec
+
+
+def main():
+    """Run the benchmark."""
+    baseline_screen = _filled_screen(_baseline_module().Screen)
+    baseline = _bench('baseline full width (Cell.copy)', baseline_screen,
+                      number=50)
+    baseline_screen.set_scroll_region(0, ROWS - 1, 1, COLUMNS - 2)
+    baseline_partial = _bench('baseline partial width (Cell.copy)',
+                              baseline_screen, number=50)
+    screen = _filled_screen(Screen)
+    full = _bench('full width (row rotation)', screen)
+    screen.set_scroll_region(0, ROWS - 1, 1, COLUMNS - 2)
+    partial = _bench('partial width (slice copy)', screen)
+    print('speedup full width: {0:.1f}x, partial width: {1:.1f}x'.format(
+        baseline / full, baseline_partial / partial))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Redraw traces used by the benchmarks.
+
+Each trace is a list of batches, and each batch is the list of updates of a
+`redraw` notification, in the same shape nvim sends them with `ext_linegrid`
+enabled (and `ext_multigrid` for the splits trace). They are generated
+deterministically, so results are comparable between runs without recording
+a live session.
+"""
+import msgpack
+from neovim.api import Window
+
+
+FG, BG = 0xd0d0d0, 0x1c1c1c
+LINE_NR, STATUS, KEYWORD, COMMENT = 1, 2, 3, 4
+
+HL_DEFS = [
+    [LINE_NR, {'foreground': 0x808080}, {}, []],
+    [STATUS, {'foreground': 0xffffff, 'background': 0x303030,
+              'bold': True}, {}, []],
+    [KEYWORD, {'foreground': 0x5fafff}, {}, []],
+    [COMMENT, {'foreground': 0x87af87, 'italic': True}, {}, []],
+]
+
+WIDE_TEXT = (u'日本語のテキストと'
+             u'中文字符\U0001f600\U0001f680')
+
+
+def _setup(columns, rows):
+    return [
+        ['grid_resize', [1, columns, rows]],
+        ['default_colors_set', [FG, BG, 0xff0000, -1, -1]],
+        ['hl_attr_define'] + HL_DEFS,
+        ['grid_clear', [1]],
+    ]
+
+
+def _window(handle):
+    # window handles arrive as ext types, which the client decodes to Window
+    # objects
+    return Window(None, (1, msgpack.packb(handle)))
+
+
+def _cells(segments, columns, wide=False):
+    # Convert (text, hl_id) segments to grid_line cells padded to the grid
+    # width, compressing repeated cells and omitting repeated hl ids like
+    # nvim does.
+    chars = []
+    for text, hl_id in segments:
+        for c in text:
+            width = 2 if wide and ord(c) > 0x2e80 else 1
+            if len(chars) + width > columns:
+                break
+            chars.append((c, hl_id))
+            if width == 2:
+                chars.append(('', hl_id))
+    chars.extend([(' ', 0)] * (columns - len(chars)))
+    cells = []
+    last_hl = None
+    for c, hl_id in chars:
+        if cells and cells[-1][0] == c and last_hl == hl_id and c:
+            cell = cells[-1]
+            if len(cell) == 1:
+                cell.extend([hl_id, 2])
+            elif len(cell) == 2:
+                cell.append(2)
+            else:
+                cell[2] += 1
+            continue
+        cells.append([c] if hl_id == last_hl else [c, hl_id])
+        last_hl = hl_id
+    return cells
+
+
+def _source_line(n, columns, wide=False):
+    segments = [('{0:>5} '.format(n), LINE_NR)]
+    if wide:
+        segments.append((WIDE_TEXT[n % 5:] + WIDE_TEXT, 0))
+    elif n % 4 == 0:
+        segments.append(('    # comment for line {0}'.format(n), COMMENT))
+    else:
+        segments.extend([('    def', KEYWORD),
+                         (' function_{0}(self, arg):'.format(n), 0)])
+    return _cells(segments, columns, wide)
+
+
+def _status_line(n, columns):
+    return _cells([(' file.py {0:>40} '.format(n), STATUS),
+                   (' ' * columns, STATUS)], columns)
+
+
+def _full_draw(first, columns, rows, wide=False, grid=1):
+    updates = [['grid_line'] +
+               [[grid, row, 0, _source_line(first + row, columns, wide)]
+                for row in range(rows - 2)]]
+    updates.append(['grid_line', [grid, rows - 2, 0,
+                                  _status_line(first, columns)]])
+    return updates
+
+
+def scroll(columns, rows, frames):
+    """Scroll through a large file one line at a time."""
+    batches = [_setup(columns, rows) + _full_draw(0, columns, rows)]
+    for n in range(frames):
+        line = n + rows - 2
+        batches.append([
+            ['grid_scroll', [1, 0, rows - 2, 0, columns, 1, 0]],
+            ['grid_line', [1, rows - 3, 0, _source_line(line, columns)],
+                          [1, rows - 2, 0, _status_line(line, columns)]],
+            ['grid_cursor_goto', [1, rows - 3, 6]],
+            ['flush', []],
+        ])
+    return batches
+
+
+def clear(columns, rows, frames):
+    """Clear and redraw the whole screen."""
+    batches = [_setup(columns, rows)]
+    for n in range(frames):
+        batches.append([['grid_clear', [1]]] +
+                       _full_draw(n, columns, rows) +
+                       [['grid_cursor_goto', [1, 0, 6]], ['flush', []]])
+    return batches
+
+
+def typing(columns, rows, frames):
+    """Type text in insert mode, one character per redraw."""
+    batches = [_setup(columns, rows) + _full_draw(0, columns, rows)]
+    text = 'the quick brown fox jumps over the lazy dog '
+    row, col = 0, 6
+    for n in range(frames):
+        if col >= columns - 1:
+            row, col = (row + 1) % (rows - 2), 6
+        updates = [['grid_line', [1, row, col, [[text[n % len(text)], 0]]]]]
+        if n % 10 == 0:
+            updates.append(['grid_line',
+                            [1, rows - 2, 0, _status_line(n, columns)]])
+        col += 1
+        updates.extend([['grid_cursor_goto', [1, row, col]], ['flush', []]])
+        batches.append(updates)
+    return batches
+
+
+def wide(columns, rows, frames):
+    """Redraw a buffer full of double width characters."""
+    batches = [_setup(columns, rows)]
+    for n in range(frames):
+        batches.append(_full_draw(n, columns, rows, wide=True) +
+                       [['grid_cursor_goto', [1, 0, 6]], ['flush', []]])
+    return batches
+
+
+def splits(columns, rows, frames):
+    """Scroll one of two vertical splits while a float moves over them."""
+    width = (columns - 1) // 2
+    left, right, float_win = _window(1000), _window(1001), _window(1002)
+    setup = _setup(columns, rows)
+    setup.append(['grid_line'] + [[1, row, width, [['|', STATUS]]]
+                                  for row in range(rows - 1)])
+    setup.extend([
+        ['grid_resize', [2, width, rows - 1], [3, width, rows - 1],
+                        [4, 20, 3]],
+        ['win_pos', [2, left, 0, 0, width, rows - 1],
+                    [3, right, 0, width + 1, width, rows - 1]],
+        ['grid_clear', [2], [3], [4]],
+        ['grid_line'] + [[4, row, 0, _cells([('float', KEYWORD)], 20)]
+                         for row in range(3)],
+    ])
+    setup.extend(_full_draw(0, width, rows, grid=2))
+    setup.extend(_full_draw(0, width, rows, grid=3))
+    batches = [setup]
+    for n in range(frames):
+        line = n + rows - 2
+        batches.append([
+            ['grid_scroll', [2, 0, rows - 2, 0, width, 1, 0]],
+            ['grid_line', [2, rows - 3, 0, _source_line(line, width)],
+                          [2, rows - 2, 0, _status_line(line, width)]],
+            ['win_float_pos', [4, float_win, 'NW', 1, n % (rows - 3),
+                               n % (columns - 20), True]],
+            ['grid_cursor_goto', [2, rows - 3, 6]],
+            ['flush', []],
+        ])
+    return batches
+
+
+TRACES = {
+    'scroll': scroll,
+    'clear': clear,
+    'typing': typing,
+    'wide': wide,
+    'splits': splits,
+}
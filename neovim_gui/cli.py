@@ -1,5 +1,6 @@
 """CLI for accessing the gtk/tickit UIs implemented by this package."""
 import shlex
+from threading import Thread
 
 import click
 
@@ -13,13 +14,30 @@ from neovim import attach, setup_logging
 @click.option('--listen', '-l')
 @click.option('--connect', '-c')
 @click.option('--font', '-f', default=('Monospace', 13), nargs=2)
+@click.option('--linegrid/--no-linegrid', default=True)
+@click.option('--multigrid/--no-multigrid', default=False)
+@click.option('--max-fps', default=60)
+@click.option('--record')
+@click.option('--replay')
+@click.option('--replay-realtime', default=False, is_flag=True)
+@click.option('--stats')
+@click.option('--stats-interval', default=5.0)
+@click.option('--trace-latency', default=False, is_flag=True)
+@click.option('--startup-trace', default=False, is_flag=True)
 @click.option('--profile',
               default='disable',
               type=click.Choice(['ncalls', 'tottime', 'percall', 'cumtime',
                                  'name', 'disable']))
 @click.pass_context
-def main(ctx, prog, notify, listen, connect, font, profile):
+def main(ctx, prog, notify, listen, connect, font, linegrid, multigrid,
+         max_fps, record, replay, replay_realtime, stats, stats_interval,
+         trace_latency, startup_trace, profile):
     """Entry point."""
+    trace = None
+    if startup_trace:
+        from .instrument import StartupTrace
+        trace = StartupTrace()
+        trace.mark('cli started')
     address = connect or listen
 
     setup_logging("gtk_ui")
@@ -35,36 +53,83 @@ def main(ctx, prog, notify, listen, connect, font, profile):
             args = ('socket',)
             kwargs = {'path': address}
 
-    if connect:
-        # connect to existing instance listening on address
-        nvim = attach(*args, **kwargs)
-    elif listen:
-        # spawn detached instance listening on address and connect to it
-        import os
-        import time
-        from subprocess import Popen
-        os.environ['NVIM_LISTEN_ADDRESS'] = address
-        nvim_argv = shlex.split(prog or 'nvim --headless') + ctx.args
-        # spawn the nvim with stdio redirected to /dev/null.
-        dnull = open(os.devnull)
-        p = Popen(nvim_argv, stdin=dnull, stdout=dnull, stderr=dnull)
-        dnull.close()
-        while p.poll() or p.returncode is None:
-            try:
-                nvim = attach(*args, **kwargs)
-                break
-            except IOError:
-                # socket not ready yet
-                time.sleep(0.050)
-    else:
-        # spawn embedded instance
-        nvim_argv = shlex.split(prog or 'nvim --embed') + ctx.args
-        nvim = attach('child', argv=nvim_argv)
+    def start_nvim():
+        if replay:
+            # feed a recorded trace to the UI instead of a nvim instance
+            from .trace import TraceSession
+            return TraceSession(replay, replay_realtime)
+        elif connect:
+            # connect to existing instance listening on address
+            return attach(*args, **kwargs)
+        elif listen:
+            # spawn detached instance listening on address and connect to it
+            import os
+            import time
+            from subprocess import Popen
+            os.environ['NVIM_LISTEN_ADDRESS'] = address
+            nvim_argv = shlex.split(prog or 'nvim --headless') + ctx.args
+            # spawn the nvim with stdio redirected to /dev/null.
+            dnull = open(os.devnull)
+            p = Popen(nvim_argv, stdin=dnull, stdout=dnull, stderr=dnull)
+            dnull.close()
+            # poll quickly at first, the socket is usually ready within a
+            # few milliseconds
+            delay = 0.002
+            while p.poll() or p.returncode is None:
+                try:
+                    return attach(*args, **kwargs)
+                except IOError:
+                    # socket not ready yet
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.050)
+        else:
+            # spawn embedded instance
+            nvim_argv = shlex.split(prog or 'nvim --embed') + ctx.args
+            return attach('child', argv=nvim_argv)
+
+    def start_nvim_thread():
+        try:
+            started.append(start_nvim())
+        except Exception as e:
+            started.append(e)
+        if trace:
+            trace.mark('nvim attached')
 
+    # nvim is started and attached to in another thread, while the Gtk stack
+    # is imported and the font is measured in this one.
+    started = []
+    nvim_thread = Thread(target=start_nvim_thread)
+    nvim_thread.daemon = True
+    nvim_thread.start()
     from .gtk_ui import GtkUI
-    ui = GtkUI(font)
+    if trace:
+        trace.mark('gtk imported')
+    ui = GtkUI(font, linegrid, max_fps, multigrid, trace)
+    ui.measure_font()
+    if trace:
+        trace.mark('font measured')
+    nvim_thread.join()
+    nvim = started[0]
+    if isinstance(nvim, Exception):
+        raise nvim
+    recorder = None
+    if record:
+        from .trace import TraceRecorder
+        recorder = TraceRecorder(record)
+    redraw_stats = None
+    if stats:
+        from .instrument import RedrawStats
+        redraw_stats = RedrawStats()
+        redraw_stats.start_dump(stats, stats_interval)
+    latency_tracer = None
+    if trace_latency:
+        from .instrument import LatencyTracer
+        latency_tracer = LatencyTracer()
     bridge = UIBridge()
-    bridge.connect(nvim, ui, profile if profile != 'disable' else None, notify)
+    bridge.connect(nvim, ui, profile if profile != 'disable' else None, notify,
+                   recorder, redraw_stats, latency_tracer)
+    if redraw_stats:
+        redraw_stats.stop_dump(stats)
 
 
 if __name__ == '__main__':
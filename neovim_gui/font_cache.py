@@ -0,0 +1,85 @@
+"""Font metrics cache persisted in the user cache directory."""
+import json
+import os
+
+
+__all__ = ('FontMetricsCache',)
+
+
+# Directories whose modification times change when fonts are installed or
+# removed, or when the fontconfig caches are rebuilt.
+FONT_DIRS = (
+    '~/.fonts',
+    '~/.local/share/fonts',
+    '~/.cache/fontconfig',
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    '/var/cache/fontconfig',
+)
+
+
+class FontMetricsCache(object):
+
+    """Map font keys to metrics, in memory and in a JSON file.
+
+    Keys are strings built by the caller, which should include everything
+    the metrics depend on, like the font description, library versions and
+    resolution. Metrics are JSON serializable dicts. Every entry stores a
+    fingerprint of the installed fonts, and entries with a fingerprint that
+    doesn't match the current one are ignored, so they are measured again
+    after fonts change. Errors reading or writing the file are ignored, the
+    cache just starts empty or isn't persisted.
+    """
+
+    def __init__(self, path=None):
+        """Initialize the FontMetricsCache instance."""
+        self._path = path or default_path()
+        self._fingerprint = fonts_fingerprint()
+        try:
+            with open(self._path) as f:
+                self._entries = json.load(f)
+            if not isinstance(self._entries, dict):
+                self._entries = {}
+        except (IOError, OSError, ValueError):
+            self._entries = {}
+
+    def get(self, key):
+        """Get the metrics stored for `key`, or None."""
+        entry = self._entries.get(key)
+        if not isinstance(entry, dict) or \
+           entry.get('fingerprint') != self._fingerprint:
+            return None
+        return entry.get('metrics')
+
+    def put(self, key, metrics):
+        """Store the metrics of `key` and write the cache file."""
+        self._entries[key] = {'fingerprint': self._fingerprint,
+                              'metrics': metrics}
+        tmp = self._path + '.tmp'
+        try:
+            directory = os.path.dirname(self._path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.rename(tmp, self._path)
+        except (IOError, OSError):
+            pass
+
+
+def default_path():
+    """Get the path of the cache file in the XDG cache directory."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'neovim_gui', 'font_metrics.json')
+
+
+def fonts_fingerprint():
+    """Get a value that changes when the installed fonts change."""
+    mtime = 0
+    for path in FONT_DIRS:
+        try:
+            mtime = max(mtime, os.stat(os.path.expanduser(path)).st_mtime)
+        except OSError:
+            pass
+    return mtime
@@ -2,6 +2,10 @@
 from __future__ import print_function, division
 import math
 import os
+import time
+from array import array
+from collections import OrderedDict, deque
+from threading import Lock
 
 import cairo
 
@@ -11,7 +15,8 @@ gi.require_version('Gdk', '3.0')
 gi.require_version('PangoCairo', '1.0')
 from gi.repository import GLib, GObject, Gdk, Gtk, Pango, PangoCairo
 
-from .screen import Screen
+from .font_cache import FontMetricsCache
+from .screen import Screen, expand_cells
 
 
 __all__ = ('GtkUI',)
@@ -60,6 +65,60 @@ KEY_TABLE = {
 }
 
 
+SCROLL_UP = 'ScrollWheelUp'
+SCROLL_DOWN = 'ScrollWheelDown'
+SCROLL_LEFT = 'ScrollWheelLeft'
+SCROLL_RIGHT = 'ScrollWheelRight'
+SCROLL_KEYS = {
+    Gdk.ScrollDirection.UP: SCROLL_UP,
+    Gdk.ScrollDirection.DOWN: SCROLL_DOWN,
+    Gdk.ScrollDirection.LEFT: SCROLL_LEFT,
+    Gdk.ScrollDirection.RIGHT: SCROLL_RIGHT,
+}
+
+
+# nvim_input_mouse button and action of the mouse keys sent by the UI, used
+# when the UI is attached with ext_multigrid
+MOUSE_ACTIONS = {
+    'LeftMouse': ('left', 'press'),
+    'MiddleMouse': ('middle', 'press'),
+    'RightMouse': ('right', 'press'),
+    'LeftDrag': ('left', 'drag'),
+    'MiddleDrag': ('middle', 'drag'),
+    'RightDrag': ('right', 'drag'),
+    SCROLL_UP: ('wheel', 'up'),
+    SCROLL_DOWN: ('wheel', 'down'),
+    SCROLL_LEFT: ('wheel', 'left'),
+    SCROLL_RIGHT: ('wheel', 'right'),
+}
+
+
+# The backing surface size is rounded up to a multiple of this number of
+# pixels, so it can be reused while the window is resized
+_SURFACE_CHUNK = 256
+
+
+# Cursor blink interval in milliseconds
+_BLINK_INTERVAL = 500
+
+
+# Maximum number of Pango layouts kept by the run layout cache
+_LAYOUT_CACHE_SIZE = 1024
+
+
+# Above this number of damaged rectangles per frame, the whole window is
+# invalidated instead.
+_MAX_DAMAGE_RECTS = 64
+
+
+# Stacking order of grids that are not drawn in the default grid. Windows
+# are drawn above the default grid, and floats and the message grid above
+# the windows. Floats use the zindex sent by nvim when it has one.
+_WINDOW_ZINDEX = 0
+_FLOAT_ZINDEX = 50
+_MESSAGE_ZINDEX = 200
+
+
 if (GLib.MAJOR_VERSION, GLib.MINOR_VERSION,) <= (2, 32,):
     GLib.threads_init()
 
@@ -74,31 +133,85 @@ class GtkUI(object):
 
     """Gtk+ UI class."""
 
-    def __init__(self, font):
-        """Initialize the UI instance."""
+    def __init__(self, font, linegrid=True, max_fps=60, multigrid=False,
+                 startup_trace=None):
+        """Initialize the UI instance.
+
+        When `linegrid` is false, the UI attaches without `ext_linegrid` and
+        receives the legacy cell based redraw events. `max_fps` caps how often
+        queued redraw batches are painted, 0 disables the cap. When
+        `multigrid` is true, the UI attaches with `ext_multigrid`, keeping a
+        screen and backing surface for each nvim grid, and `linegrid` is
+        implied. If a `startup_trace` is given, the startup phases of the UI
+        are marked in it until the first frame is drawn.
+        """
+        self._linegrid = linegrid or multigrid
+        self._multigrid = multigrid
+        self._startup_trace = startup_trace
+        self._frame_interval = 1.0 / max_fps if max_fps else 0
+        self._last_frame = 0
+        self._updates = deque()
+        self._updates_lock = Lock()
+        self._drain_scheduled = False
+        self._frame_stats = {'frames': 0, 'batches': 0, 'merged': 0,
+                             'max_batches_per_frame': 0}
         self._redraw_arg = None
         self._foreground = -1
         self._background = -1
         self._font_name = font[0]
         self._font_size = font[1]
+        # state of each grid. The screen, backing surface and pending span of
+        # the grid being updated are also kept in the attributes below, see
+        # _select_grid. Without ext_multigrid, only grid 1 exists.
+        self._grid = _Grid(1)
+        self._grid.visible = True
+        self._grids = {1: self._grid}
+        self._grid_order = 0
+        self._cursor_grid = 1
         self._screen = None
-        self._attrs = None
+        self._attrs = 0
+        # highlight ids stored in the screen are mapped to nvim attribute
+        # dicts by this table. Id 0 is reserved for the default attributes.
+        self._hl_ids = {(): 0}
+        self._hl_defs = [None]
         self._busy = False
         self._mouse_enabled = False
         self._insert_cursor = False
         self._blink = False
-        self._blink_timer_id = None
+        self._blink_source = None
         self._resize_timer_id = None
         self._pressed = None
+        self._pressed_cell = None
+        self._scroll_delta = [0.0, 0.0]
         self._invalid = None
-        self._pending = [0, 0, 0]
+        self._pending = self._grid.pending
+        # rectangles of the backing surface changed since the last draw, and
+        # the cursor rectangle drawn in the window by the last draw
+        self._damage = []
+        self._damage_all = False
+        self._cursor_rect = None
+        self._layout_cache = _LRUCache(_LAYOUT_CACHE_SIZE)
+        self._font_str = None
+        self._font_cache = FontMetricsCache()
+        self._cairo_surface = None
+        self._surface_size = (0, 0,)
         self._reset_cache()
 
+    def measure_font(self):
+        """Measure the font before the UI is started.
+
+        The font is otherwise measured when nvim first resizes the screen.
+        This doesn't need a window, so it can be done while nvim starts.
+        """
+        self._update_font()
+
     def start(self, bridge):
         """Start the UI event loop."""
         debug_ext_env = os.environ.get("NVIM_PYTHON_UI_DEBUG_EXT", "")
         extra_exts = {x:True for x in debug_ext_env.split(",") if x}
-        bridge.attach(80, 24, rgb=True, **extra_exts)
+        bridge.attach(80, 24, rgb=True, ext_linegrid=self._linegrid,
+                      ext_multigrid=self._multigrid, **extra_exts)
+        self._startup_mark('ui attach requested')
         drawing_area = Gtk.DrawingArea()
         drawing_area.connect('draw', self._gtk_draw)
         window = Gtk.Window()
@@ -107,7 +220,8 @@ class GtkUI(object):
                           Gdk.EventMask.BUTTON_PRESS_MASK |
                           Gdk.EventMask.BUTTON_RELEASE_MASK |
                           Gdk.EventMask.POINTER_MOTION_MASK |
-                          Gdk.EventMask.SCROLL_MASK)
+                          Gdk.EventMask.SCROLL_MASK |
+                          Gdk.EventMask.SMOOTH_SCROLL_MASK)
         window.connect('configure-event', self._gtk_configure)
         window.connect('delete-event', self._gtk_quit)
         window.connect('key-press-event', self._gtk_key)
@@ -128,6 +242,7 @@ class GtkUI(object):
         self._window = window
         self._im_context = im_context
         self._bridge = bridge
+        self._startup_mark('window shown')
         Gtk.main()
 
     def quit(self):
@@ -135,43 +250,247 @@ class GtkUI(object):
         GObject.idle_add(Gtk.main_quit)
 
     def schedule_screen_update(self, apply_updates):
-        """Schedule screen updates to run in the UI event loop."""
-        def wrapper():
-            apply_updates()
+        """Schedule screen updates to run in the UI event loop.
+
+        Batches queued before the UI event loop gets to them are applied
+        together and painted as a single frame.
+        """
+        self._updates.append(apply_updates)
+        with self._updates_lock:
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        delay = self._last_frame + self._frame_interval - time.time()
+        if delay > 0:
+            GLib.timeout_add(int(delay * 1000) + 1, self._drain_updates)
+        else:
+            GObject.idle_add(self._drain_updates)
+
+    def get_frame_stats(self):
+        """Get counters of redraw batches merged into painted frames."""
+        return dict(self._frame_stats)
+
+    def get_layout_cache_stats(self):
+        """Get the size and hit/miss counters of the layout cache."""
+        cache = self._layout_cache
+        return {'size': len(cache), 'hits': cache.hits,
+                'misses': cache.misses}
+
+    def _drain_updates(self):
+        with self._updates_lock:
+            self._drain_scheduled = False
+        updates = self._updates
+        count = 0
+        while updates:
+            updates.popleft()()
+            count += 1
+        if count:
+            if self._startup_trace:
+                self._startup_mark('first redraw applied')
             self._flush()
             self._start_blinking()
             self._screen_invalid()
-        GObject.idle_add(wrapper)
+            self._last_frame = time.time()
+            stats = self._frame_stats
+            stats['frames'] += 1
+            stats['batches'] += count
+            stats['merged'] += count - 1
+            if count > stats['max_batches_per_frame']:
+                stats['max_batches_per_frame'] = count
+            if self._bridge.stats:
+                self._bridge.stats.frame_drawn(count)
+        return False
+
+    def _startup_mark(self, phase):
+        # phases are only marked the first time they are reached
+        trace = self._startup_trace
+        if trace and phase not in (p for p, _ in trace.phases):
+            trace.mark(phase)
 
     def _screen_invalid(self):
-        self._drawing_area.queue_draw()
+        # Only invalidate what changed. The cursor is not part of the backing
+        # surface, so the cells it was drawn on and moved to are always
+        # invalidated.
+        damage = self._damage
+        if self._damage_all or len(damage) > _MAX_DAMAGE_RECTS:
+            self._drawing_area.queue_draw()
+        else:
+            for x, y, w, h in damage:
+                self._drawing_area.queue_draw_area(x, y, w, h)
+            self._cursor_invalid()
+        self._damage = []
+        self._damage_all = False
+
+    def _damage_region(self, top, bot, left, right):
+        # regions are relative to the current grid, damage is relative to
+        # the window
+        grid = self._grid
+        if not grid.visible:
+            return
+        x1, y1, x2, y2 = self._get_rect(grid.row + top, grid.row + bot,
+                                        grid.col + left, grid.col + right)
+        self._damage.append((x1, y1, x2 - x1, y2 - y1,))
+
+    def _damage_grid(self, grid):
+        # damage the window area covered by a grid
+        if grid.visible and grid.screen:
+            x1, y1, x2, y2 = self._get_rect(
+                grid.row, grid.row + grid.screen.rows,
+                grid.col, grid.col + grid.screen.columns)
+            self._damage.append((x1, y1, x2 - x1, y2 - y1,))
+
+    def _get_cursor_rect(self):
+        # include the next cell to cover double width characters
+        grid = self._grids[self._cursor_grid]
+        row, col = grid.screen.row, grid.screen.col
+        x, y = self._get_coords(grid.row + row, grid.col + col)
+        ncells = min(2, max(1, grid.screen.columns - col))
+        return (x, y, self._cell_pixel_width * ncells,
+                self._cell_pixel_height,)
+
+    def _select_grid(self, handle):
+        # Make a grid the target of the following events. The attributes
+        # used by the drawing code are pointed to the grid's screen, surface
+        # and pending span, after drawing the pending span of the previous
+        # grid.
+        if handle == self._grid.handle:
+            return
+        self._flush()
+        grid = self._get_grid(handle)
+        self._grid = grid
+        self._screen = grid.screen
+        self._cairo_surface = grid.surface
+        self._cairo_context = grid.context
+        self._surface_size = grid.surface_size
+        self._pending = grid.pending
+
+    def _get_grid(self, handle):
+        grid = self._grids.get(handle)
+        if grid is None:
+            grid = self._grids[handle] = _Grid(handle)
+        return grid
+
+    def _visible_grids(self):
+        # visible grids, from bottom to top
+        grids = [grid for grid in self._grids.values()
+                 if grid.visible and grid.screen]
+        grids.sort(key=lambda grid: (grid.zindex, grid.order,))
+        return grids
+
+    def _place_grid(self, handle, row, col, zindex):
+        # Show a grid at a window position. Only the area it leaves and the
+        # area it covers are damaged, the window is composed from the
+        # backing surfaces of the grids.
+        grid = self._get_grid(handle)
+        if grid.visible and (grid.row, grid.col, grid.zindex,) == \
+                (row, col, zindex,):
+            return
+        self._damage_grid(grid)
+        self._grid_order += 1
+        grid.row, grid.col, grid.zindex = row, col, zindex
+        grid.order = self._grid_order
+        grid.visible = True
+        self._damage_grid(grid)
+
+    def _hide_grid(self, handle):
+        grid = self._grids.get(handle)
+        if grid and grid.handle != 1:
+            self._damage_grid(grid)
+            grid.visible = False
 
     def _nvim_resize(self, columns, rows):
-        da = self._drawing_area
-        # create FontDescription object for the selected font/size
+        self._resize_grid(columns, rows)
+        # calculate the total pixel width/height of the drawing area
+        pixel_width = self._cell_pixel_width * columns
+        pixel_height = self._cell_pixel_height * rows
+        self._pixel_width, self._pixel_height = pixel_width, pixel_height
+        self._cursor_rect = None
+        self._window.resize(pixel_width, pixel_height)
+
+    def _resize_grid(self, columns, rows):
+        self._update_font()
+        screen = self._screen
+        if screen:
+            # draw pending text while it still fits the old size
+            self._flush()
+        self._resize_surface(self._cell_pixel_width * columns,
+                             self._cell_pixel_height * rows)
+        if screen:
+            # keep the current contents, clearing the cells that were added
+            old_columns, old_rows = screen.columns, screen.rows
+            screen.resize(columns, rows)
+            if columns > old_columns:
+                self._clear_region(0, min(rows, old_rows), old_columns,
+                                   columns)
+            if rows > old_rows:
+                self._clear_region(old_rows, rows, 0, columns)
+        else:
+            self._screen = self._grid.screen = Screen(columns, rows)
+        self._damage_all = True
+
+    def _update_font(self):
+        # Font metrics only depend on the font, so they are only measured
+        # again when it changes. They are also kept in a cache file, so they
+        # are not measured at startup either, until the font, Pango, the
+        # resolution or the installed fonts change.
         font_str = '{0} {1}'.format(self._font_name, self._font_size)
-        self._font, pixels, normal_width, bold_width = _parse_font(font_str)
+        if font_str == self._font_str:
+            return
+        key = '{0}|pango {1}|{2} dpi'.format(
+            font_str, Pango.version_string(),
+            PangoCairo.FontMap.get_default().get_resolution())
+        metrics = self._font_cache.get(key)
+        if metrics is None:
+            # create FontDescription object for the selected font/size
+            fd, pixels, normal_width, bold_width = _parse_font(font_str)
+            metrics = {'pixels': list(pixels), 'normal_width': normal_width,
+                       'bold_width': bold_width,
+                       'resolved': _resolved_font(fd)}
+            self._font_cache.put(key, metrics)
+        else:
+            fd = Pango.font_description_from_string(font_str)
+        self._font = fd
         # calculate the letter_spacing required to make bold have the same
         # width as normal
-        self._bold_spacing = normal_width - bold_width
-        cell_pixel_width, cell_pixel_height = pixels
-        # calculate the total pixel width/height of the drawing area
-        pixel_width = cell_pixel_width * columns
-        pixel_height = cell_pixel_height * rows
-        gdkwin = da.get_window()
-        content = cairo.CONTENT_COLOR
-        self._cairo_surface = gdkwin.create_similar_surface(content,
-                                                            pixel_width,
-                                                            pixel_height)
+        self._bold_spacing = metrics['normal_width'] - metrics['bold_width']
+        self._char_width = metrics['normal_width']
+        self._cell_pixel_width, self._cell_pixel_height = metrics['pixels']
+        self._font_str = font_str
+        # cached attributes and layouts were created with the old font
+        self._reset_cache()
+
+    def _resize_surface(self, width, height):
+        # The backing surface is allocated in chunks and only replaced when
+        # it is too small, copying what was drawn on the old one.
+        old = self._cairo_surface
+        old_width, old_height = self._surface_size
+        if width <= old_width and height <= old_height:
+            return
+        width = -(-max(width, old_width) // _SURFACE_CHUNK) * _SURFACE_CHUNK
+        height = -(-max(height, old_height) // _SURFACE_CHUNK) * _SURFACE_CHUNK
+        self._surface_size = (width, height,)
+        self._cairo_surface = self._create_surface(width, height)
         self._cairo_context = cairo.Context(self._cairo_surface)
-        self._pango_layout = PangoCairo.create_layout(self._cairo_context)
-        self._pango_layout.set_alignment(Pango.Alignment.LEFT)
-        self._pango_layout.set_font_description(self._font)
-        self._pixel_width, self._pixel_height = pixel_width, pixel_height
-        self._cell_pixel_width = cell_pixel_width
-        self._cell_pixel_height = cell_pixel_height
-        self._screen = Screen(columns, rows)
-        self._window.resize(pixel_width, pixel_height)
+        if old:
+            old.flush()
+            self._cairo_context.set_source_surface(old, 0, 0)
+            self._cairo_context.paint()
+        grid = self._grid
+        grid.surface = self._cairo_surface
+        grid.context = self._cairo_context
+        grid.surface_size = self._surface_size
+
+    def _create_surface(self, width, height):
+        gdkwin = self._drawing_area.get_window()
+        return gdkwin.create_similar_surface(cairo.CONTENT_COLOR, width,
+                                             height)
+
+    def _nvim_grid_resize(self, grid, columns, rows):
+        self._select_grid(grid)
+        if grid == 1:
+            self._nvim_resize(columns, rows)
+        else:
+            self._resize_grid(columns, rows)
 
     def _nvim_clear(self):
         self._clear_region(self._screen.top, self._screen.bot + 1,
@@ -183,9 +502,55 @@ class GtkUI(object):
         self._clear_region(row, row + 1, col, self._screen.right + 1)
         self._screen.eol_clear()
 
+    def _nvim_grid_clear(self, grid):
+        self._select_grid(grid)
+        self._nvim_clear()
+
     def _nvim_cursor_goto(self, row, col):
         self._screen.cursor_goto(row, col)
 
+    def _nvim_grid_cursor_goto(self, grid, row, col):
+        self._select_grid(grid)
+        self._cursor_grid = grid
+        self._screen.cursor_goto(row, col)
+
+    def _nvim_win_pos(self, grid, win, startrow, startcol, width, height):
+        self._place_grid(grid, startrow, startcol, _WINDOW_ZINDEX)
+
+    def _nvim_win_float_pos(self, grid, win, anchor, anchor_grid, anchor_row,
+                            anchor_col, focusable, zindex=_FLOAT_ZINDEX):
+        # the anchor position is relative to the anchor grid, and is the
+        # corner of the float given by `anchor`
+        screen = self._get_grid(grid).screen
+        base = self._get_grid(anchor_grid)
+        row = base.row + anchor_row
+        col = base.col + anchor_col
+        if screen and anchor[0] == 'S':
+            row -= screen.rows
+        if screen and anchor[1] == 'E':
+            col -= screen.columns
+        self._place_grid(grid, max(0, int(round(row))),
+                         max(0, int(round(col))), zindex)
+
+    def _nvim_win_hide(self, grid):
+        self._hide_grid(grid)
+
+    def _nvim_win_close(self, grid):
+        self._hide_grid(grid)
+
+    def _nvim_msg_set_pos(self, grid, row, scrolled, sep_char):
+        self._place_grid(grid, row, 0, _MESSAGE_ZINDEX)
+
+    def _nvim_grid_destroy(self, grid):
+        if grid == 1:
+            return
+        if grid == self._grid.handle:
+            self._select_grid(1)
+        if grid == self._cursor_grid:
+            self._cursor_grid = 1
+        self._hide_grid(grid)
+        self._grids.pop(grid, None)
+
     def _nvim_busy_start(self):
         self._busy = True
 
@@ -253,23 +618,83 @@ class GtkUI(object):
         # Do the move
         self._cairo_context.paint()
         self._cairo_context.restore()
+        self._damage_region(dst_top, dst_bot, left, right)
         # Clear the emptied region
         self._clear_region(clr_top, clr_bot, left, right)
         self._screen.scroll(count)
 
-    def _nvim_highlight_set(self, attrs):
-        self._attrs = self._get_pango_attrs(attrs)
+    def _nvim_grid_scroll(self, grid, top, bot, left, right, rows, cols):
+        # grid_scroll carries its own region, with exclusive bot/right. The
+        # screen region is restored afterwards so grid_clear clears it all.
+        self._select_grid(grid)
+        screen = self._screen
+        screen.set_scroll_region(top, bot - 1, left, right - 1)
+        self._nvim_scroll(rows)
+        screen.set_scroll_region(0, screen.rows - 1, 0, screen.columns - 1)
+
+    # The _prepare_<event> methods are called by UIBridge in the nvim event
+    # loop, before the update is queued for the UI thread. They turn the
+    # arguments of the event into what its handler needs to update the
+    # screen, and must not access the UI state.
+    def _prepare_highlight_set(self, updates):
+        return [[args[0], _hl_key(args[0])] for args in updates]
+
+    def _prepare_put(self, updates):
+        # all puts of the update become a single list of cells
+        return [[[args[0] for args in updates]]]
+
+    def _prepare_grid_line(self, updates):
+        rv = []
+        for args in updates:
+            text, attrs = expand_cells(args[3])
+            rv.append([args[0], args[1], args[2], text, attrs])
+        return rv
 
-    def _nvim_put(self, text):
-        if self._screen.row != self._pending[0]:
+    def _nvim_highlight_set(self, attrs, key):
+        self._attrs = self._get_hl_id(attrs, key)
+
+    def _nvim_hl_attr_define(self, hl_id, rgb_attrs, cterm_attrs, info):
+        defs = self._hl_defs
+        if hl_id >= len(defs):
+            defs.extend([None] * (hl_id + 1 - len(defs)))
+        defs[hl_id] = rgb_attrs
+        if self._pango_attrs_cache.pop(hl_id, None) is not None:
+            # cached layouts can refer to the previous definition
+            self._layout_cache.clear()
+
+    def _nvim_grid_line(self, grid, row, col_start, text, attrs):
+        self._select_grid(grid)
+        if row != self._pending[0]:
             # flush pending text if jumped to a different row
             self._flush()
-        # work around some redraw glitches that can happen
-        self._redraw_glitch_fix()
-        # Update internal screen
-        self._screen.put(self._get_pango_text(text), self._attrs)
-        self._pending[1] = min(self._screen.col - 1, self._pending[1])
-        self._pending[2] = max(self._screen.col, self._pending[2])
+        col_end = self._screen.put_cells(row, col_start, text, attrs)
+        pending = self._pending
+        if pending[0] != row or pending[1] == pending[2]:
+            pending[0], pending[1], pending[2] = row, col_start, col_end
+        else:
+            pending[1] = min(col_start, pending[1])
+            pending[2] = max(col_end, pending[2])
+
+    def _nvim_flush(self):
+        self._flush()
+
+    def _nvim_batch_put(self, updates):
+        # Every put of a redraw update is handled in one call to avoid the
+        # per character dispatch. _prepare_put joined the puts into a single
+        # list of cells, which are written at the cursor, flushing pending
+        # text first if the cursor jumped to a different row.
+        screen = self._screen
+        pending = self._pending
+        for args in updates:
+            text = args[0]
+            if screen.row != pending[0]:
+                self._flush()
+            row, col = screen.row, screen.col
+            end = screen.put_cells(row, col, text,
+                                   array('i', [self._attrs]) * len(text))
+            screen.cursor_goto(row, end)
+            pending[1] = min(col, pending[1])
+            pending[2] = max(end, pending[2])
 
     def _nvim_bell(self):
         self._window.get_window().beep()
@@ -278,12 +703,41 @@ class GtkUI(object):
         pass
 
     def _nvim_update_fg(self, fg):
-        self._foreground = fg
-        self._reset_cache()
+        self._set_default_colors(fg, self._background)
 
     def _nvim_update_bg(self, bg):
+        self._set_default_colors(self._foreground, bg)
+
+    def _nvim_default_colors_set(self, rgb_fg, rgb_bg, rgb_sp, cterm_fg,
+                                 cterm_bg):
+        self._set_default_colors(rgb_fg, rgb_bg)
+
+    def _set_default_colors(self, fg, bg):
+        if (fg, bg,) == (self._foreground, self._background,):
+            return
+        self._foreground = fg
         self._background = bg
         self._reset_cache()
+        # cells without highlight, and the backgrounds of highlights without
+        # one, use the default colors, so everything already drawn is stale
+        self._redraw_grids()
+
+    def _redraw_grids(self):
+        # Draw every row of every grid again from its screen.
+        if not self._screen:
+            # nothing was drawn yet
+            return
+        self._flush()
+        current = self._grid.handle
+        for handle, grid in list(self._grids.items()):
+            if not grid.screen:
+                continue
+            self._select_grid(handle)
+            for row in range(grid.screen.rows):
+                self._pending[:] = [row, 0, grid.screen.columns]
+                self._flush()
+        self._select_grid(current)
+        self._damage_all = True
 
     def _nvim_suspend(self):
         self._window.iconify()
@@ -295,30 +749,49 @@ class GtkUI(object):
         self._window.set_icon_name(icon)
 
     def _gtk_draw(self, wid, cr):
-        if not self._screen:
+        if not self._grids[1].screen:
             return
+        started = time.time()
         # from random import random
         # cr.rectangle(0, 0, self._pixel_width, self._pixel_height)
         # cr.set_source_rgb(random(), random(), random())
         # cr.fill()
-        self._cairo_surface.flush()
-        cr.save()
-        cr.rectangle(0, 0, self._pixel_width, self._pixel_height)
-        cr.clip()
-        cr.set_source_surface(self._cairo_surface, 0, 0)
-        cr.paint()
-        cr.restore()
+        # The window is composed from the backing surface of each visible
+        # grid, painted at its position.
+        for grid in self._visible_grids():
+            grid.surface.flush()
+            x1, y1, x2, y2 = self._get_rect(
+                grid.row, grid.row + grid.screen.rows,
+                grid.col, grid.col + grid.screen.columns)
+            cr.save()
+            cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+            cr.clip()
+            cr.set_source_surface(grid.surface, x1, y1)
+            cr.paint()
+            cr.restore()
+        self._cursor_rect = None
         if not self._busy and self._blink:
             # Cursor is drawn separately in the window. This approach is
             # simpler because it doesn't taint the internal cairo surface,
             # which is used for scrolling
-            row, col = self._screen.row, self._screen.col
-            text, attrs = self._screen.get_cursor()
-            self._pango_draw(row, col, [(text, attrs,)], cr=cr, cursor=True)
+            self._cursor_rect = self._get_cursor_rect()
+            grid = self._grids[self._cursor_grid]
+            row = grid.row + grid.screen.row
+            col = grid.col + grid.screen.col
+            text, attrs = grid.screen.get_cursor()
+            self._pango_draw(row, col, [(text, attrs, (),)], cr=cr,
+                             cursor=True)
             x, y = self._get_coords(row, col)
             currect = Rectangle(x, y, self._cell_pixel_width,
                                 self._cell_pixel_height)
             self._im_context.set_cursor_location(currect)
+        if self._bridge.stats:
+            self._bridge.stats.painted(started)
+        if self._bridge.latency_tracer:
+            self._bridge.latency_tracer.painted()
+        if self._startup_trace:
+            self._startup_mark('first frame drawn')
+            self._startup_trace = None
 
     def _gtk_configure(self, widget, event):
         def resize(*args):
@@ -326,11 +799,12 @@ class GtkUI(object):
             width, height = self._window.get_size()
             columns = width // self._cell_pixel_width
             rows = height // self._cell_pixel_height
-            if self._screen.columns == columns and self._screen.rows == rows:
+            screen = self._grids[1].screen
+            if screen.columns == columns and screen.rows == rows:
                 return
             self._bridge.resize(columns, rows)
 
-        if not self._screen:
+        if not self._grids[1].screen:
             return
         if event.width == self._pixel_width and \
            event.height == self._pixel_height:
@@ -375,12 +849,10 @@ class GtkUI(object):
             button = 'Middle'
         elif event.button == 3:
             button = 'Right'
-        col = int(math.floor(event.x / self._cell_pixel_width))
-        row = int(math.floor(event.y / self._cell_pixel_height))
-        input_str = _stringify_key(button + 'Mouse', event.state)
-        input_str += '<{0},{1}>'.format(col, row)
-        self._bridge.input(input_str)
+        cell = self._mouse_cell(event)
+        self._input_mouse(button + 'Mouse', event.state, cell)
         self._pressed = button
+        self._pressed_cell = cell
         return True
 
     def _gtk_button_release(self, widget, event, *args):
@@ -389,26 +861,74 @@ class GtkUI(object):
     def _gtk_motion_notify(self, widget, event, *args):
         if not self._mouse_enabled or not self._pressed:
             return
-        col = int(math.floor(event.x / self._cell_pixel_width))
-        row = int(math.floor(event.y / self._cell_pixel_height))
-        input_str = _stringify_key(self._pressed + 'Drag', event.state)
-        input_str += '<{0},{1}>'.format(col, row)
-        self._bridge.input(input_str)
+        # drags are sent to the grid where the button was pressed
+        cell = self._mouse_cell(event, self._pressed_cell[0])
+        if cell == self._pressed_cell:
+            # only send drags when the pointer moves to another cell
+            return
+        self._pressed_cell = cell
+        self._input_mouse(self._pressed + 'Drag', event.state, cell, 'drag')
 
     def _gtk_scroll(self, widget, event, *args):
         if not self._mouse_enabled:
             return
+        cell = self._mouse_cell(event)
+        if event.direction == Gdk.ScrollDirection.SMOOTH:
+            keys = self._smooth_scroll_keys(event.delta_x, event.delta_y)
+        elif event.direction in SCROLL_KEYS:
+            keys = [SCROLL_KEYS[event.direction]]
+        else:
+            return
+        for key in keys:
+            self._input_mouse(key, event.state, cell, 'scroll')
+
+    def _mouse_cell(self, event, handle=None):
+        # Get the grid under the pointer, or the grid `handle`, and the
+        # position of the pointer in it, as a (grid, row, col) tuple.
         col = int(math.floor(event.x / self._cell_pixel_width))
         row = int(math.floor(event.y / self._cell_pixel_height))
-        if event.direction == Gdk.ScrollDirection.UP:
-            key = 'ScrollWheelUp'
-        elif event.direction == Gdk.ScrollDirection.DOWN:
-            key = 'ScrollWheelDown'
-        else:
+        if handle is None:
+            handle = 1
+            for grid in reversed(self._visible_grids()):
+                if grid.row <= row < grid.row + grid.screen.rows and \
+                   grid.col <= col < grid.col + grid.screen.columns:
+                    handle = grid.handle
+                    break
+        grid = self._grids.get(handle, self._grids[1])
+        return (grid.handle, row - grid.row, col - grid.col,)
+
+    def _input_mouse(self, key, state, cell, kind=None):
+        # Send a mouse key to nvim. With ext_multigrid nvim needs to know
+        # the grid, so nvim_input_mouse is used instead of key codes.
+        grid, row, col = cell
+        if self._multigrid:
+            button, action = MOUSE_ACTIONS[key]
+            self._bridge.input_mouse(button, action,
+                                     '-'.join(_modifier_names(state)),
+                                     grid, row, col)
             return
-        input_str = _stringify_key(key, event.state)
+        input_str = _stringify_key(key, state)
         input_str += '<{0},{1}>'.format(col, row)
-        self._bridge.input(input_str)
+        if kind == 'drag':
+            self._bridge.input_drag(input_str)
+        elif kind == 'scroll':
+            self._bridge.input_scroll(input_str)
+        else:
+            self._bridge.input(input_str)
+
+    def _smooth_scroll_keys(self, delta_x, delta_y):
+        # Accumulate smooth scroll deltas and convert each whole unit to a
+        # scroll wheel tick, keeping the remainder for the next event.
+        delta = self._scroll_delta
+        delta[0] += delta_x
+        delta[1] += delta_y
+        keys = []
+        for i, (neg, pos) in enumerate(((SCROLL_LEFT, SCROLL_RIGHT,),
+                                        (SCROLL_UP, SCROLL_DOWN,),)):
+            ticks = int(delta[i])
+            delta[i] -= ticks
+            keys.extend([pos if ticks > 0 else neg] * abs(ticks))
+        return keys
 
     def _gtk_focus_in(self, *a):
         self._im_context.focus_in()
@@ -420,24 +940,38 @@ class GtkUI(object):
         self._bridge.input(input_str.replace('<', '<lt>'))
 
     def _start_blinking(self):
-        def blink(*args):
-            self._blink = not self._blink
-            self._screen_invalid()
-            self._blink_timer_id = GLib.timeout_add(500, blink)
-        if self._blink_timer_id:
-            GLib.source_remove(self._blink_timer_id)
-        self._blink = False
-        blink()
+        # Show the cursor and restart the blink period. The timer source is
+        # created once and only has its expiration moved afterwards.
+        self._blink = True
+        if self._blink_source is None:
+            self._blink_source = GLib.timeout_source_new(_BLINK_INTERVAL)
+            self._blink_source.set_callback(self._blink_cursor)
+            self._blink_source.attach(None)
+        else:
+            self._blink_source.set_ready_time(
+                GLib.get_monotonic_time() + _BLINK_INTERVAL * 1000)
+
+    def _blink_cursor(self, *args):
+        self._blink = not self._blink
+        self._cursor_invalid()
+        return True
+
+    def _cursor_invalid(self):
+        # Invalidate the cells the cursor was drawn on and is moving to,
+        # without touching the rest of the window.
+        if self._cursor_rect:
+            self._drawing_area.queue_draw_area(*self._cursor_rect)
+        self._drawing_area.queue_draw_area(*self._get_cursor_rect())
 
     def _clear_region(self, top, bot, left, right):
-        self._flush()
-        self._cairo_context.save()
-        self._mask_region(top, bot, left, right)
-        r, g, b = _split_color(self._background)
-        r, g, b = r / 255.0, g / 255.0, b / 255.0
-        self._cairo_context.set_source_rgb(r, g, b)
-        self._cairo_context.paint()
-        self._cairo_context.restore()
+        # The cleared cells are also cleared in the screen, and pending text
+        # is drawn from the screen, so it doesn't need to be flushed first.
+        cr = self._cairo_context
+        x1, y1, x2, y2 = self._get_rect(top, bot, left, right)
+        cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+        cr.set_source_rgb(*_cairo_color(self._background))
+        cr.fill()
+        self._damage_region(top, bot, left, right)
 
     def _mask_region(self, top, bot, left, right, cr=None):
         if not cr:
@@ -463,121 +997,235 @@ class GtkUI(object):
         self._pending[2] = self._screen.col
         if startcol == endcol:
             return
-        self._cairo_context.save()
+        # work around some redraw glitches that can happen when updating
+        # cells in italic or bold words (characters can be clipped or leave
+        # remains when removed), by redrawing the whole words around the
+        # updated cells. This is done once for everything pending instead of
+        # once per updated cell.
+        startcol, endcol = self._screen.word_span(row, startcol, endcol)
+        runs = list(self._screen.iter(row, row, startcol, endcol - 1))
+        cr = self._cairo_context
+        # The span is drawn in two passes. Backgrounds are filled first, as
+        # one rectangle for adjacent runs of the same color and one fill per
+        # color.
+        fills = {}
+        last = None
+        ends = [run[1] for run in runs[1:]] + [endcol]
+        for (_, col, _, attrs, _), end in zip(runs, ends):
+            color = self._get_pango_attrs(attrs)[3]
+            if last and last[1] == col and last[2] == color:
+                last[1] = end
+            else:
+                last = [col, end, color]
+                fills.setdefault(color, []).append(last)
+        for color, rects in fills.items():
+            for col, end, _ in rects:
+                x1, y1, x2, y2 = self._get_rect(row, row + 1, col, end)
+                cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+            cr.set_source_rgb(*color)
+            cr.fill()
+        # Then the text is drawn without background, in one layout per
+        # sequence of runs with the same weight. Runs of spaces without
+        # underline have nothing to draw and are skipped.
         ccol = startcol
         buf = []
         bold = False
-        for _, col, text, attrs in self._screen.iter(row, row, startcol,
-                                                     endcol - 1):
-            newbold = attrs and 'bold' in attrs[0]
-            if newbold != bold or not text:
+        for _, col, text, attrs, wide in runs:
+            pango_attrs = self._get_pango_attrs(attrs)
+            blank = not pango_attrs[4] and not text.strip(' ')
+            if blank or pango_attrs[2] != bold:
                 if buf:
                     self._pango_draw(row, ccol, buf)
-                bold = newbold
-                buf = [(text, attrs,)]
+                buf = []
+                bold = pango_attrs[2]
+                if blank:
+                    continue
+            if not buf:
                 ccol = col
-            else:
-                buf.append((text, attrs,))
+            buf.append((text, attrs, wide,))
         if buf:
             self._pango_draw(row, ccol, buf)
-        self._cairo_context.restore()
+        self._damage_region(row, row + 1, startcol, endcol)
 
     def _pango_draw(self, row, col, data, cr=None, cursor=False):
-        markup = []
-        for text, attrs in data:
-            if not attrs:
-                attrs = self._get_pango_attrs(None)
-            attrs = attrs[1] if cursor else attrs[0]
-            markup.append('<span {0}>{1}</span>'.format(attrs, text))
-        markup = ''.join(markup)
-        self._pango_layout.set_markup(markup, -1)
-        # Draw the text
+        # Layouts are cached by their content, so runs that are drawn again,
+        # like status lines or line numbers, skip shaping.
         if not cr:
             cr = self._cairo_context
+        key = (tuple(data), cursor,)
+        cached = self._layout_cache.get(key)
+        if cached is None:
+            # The text is set as is, and the attributes of each part are
+            # applied to its byte range. Double width glyphs get letter
+            # spacing that makes them advance by exactly two cells, so they
+            # don't need a layout of their own.
+            attr_list = Pango.AttrList()
+            buf = []
+            index = 0
+            offset = 0
+            for text, attrs, wide in data:
+                end = index + len(text.encode('utf-8'))
+                attrs = self._get_pango_attrs(attrs or 0)
+                for attr in attrs[1] if cursor else attrs[0]:
+                    attr = attr.copy()
+                    attr.start_index = index
+                    attr.end_index = end
+                    attr_list.insert(attr)
+                for start, stop in wide:
+                    glyph = text[start:stop]
+                    spacing = self._wide_spacing(glyph, attrs[2], cr)
+                    if index == 0 and start == 0:
+                        # Pango drops the spacing before the first grapheme
+                        # of a line, the layout is moved right instead
+                        offset = _leading_spacing(spacing)
+                    attr = Pango.attr_letter_spacing_new(spacing)
+                    attr.start_index = index + len(
+                        text[:start].encode('utf-8'))
+                    attr.end_index = attr.start_index + len(
+                        glyph.encode('utf-8'))
+                    attr_list.insert(attr)
+                buf.append(text)
+                index = end
+            layout = PangoCairo.create_layout(cr)
+            layout.set_alignment(Pango.Alignment.LEFT)
+            layout.set_font_description(self._font)
+            layout.set_text(''.join(buf), -1)
+            layout.set_attributes(attr_list)
+            cached = (layout, offset / Pango.SCALE,)
+            self._layout_cache.put(key, cached)
+        layout, offset = cached
+        # Draw the text
         x, y = self._get_coords(row, col)
         if cursor and self._insert_cursor:
             cr.rectangle(x, y, self._cell_pixel_width / 4,
                          self._cell_pixel_height)
             cr.clip()
-        cr.move_to(x, y)
-        PangoCairo.update_layout(cr, self._pango_layout)
-        PangoCairo.show_layout(cr, self._pango_layout)
-        _, r = self._pango_layout.get_pixel_extents()
+        cr.move_to(x + offset, y)
+        PangoCairo.update_layout(cr, layout)
+        PangoCairo.show_layout(cr, layout)
+
+    def _wide_spacing(self, glyph, bold, cr):
+        # Letter spacing that makes a double width glyph advance by two
+        # cells, measured once per glyph since its width depends on the font
+        # that has it.
+        key = (glyph, bold,)
+        rv = self._wide_spacing_cache.get(key)
+        if rv is None:
+            layout = PangoCairo.create_layout(cr)
+            layout.set_font_description(self._font)
+            if bold:
+                attr_list = Pango.AttrList()
+                attr_list.insert(Pango.attr_weight_new(Pango.Weight.BOLD))
+                layout.set_attributes(attr_list)
+            layout.set_text(glyph, -1)
+            width, _ = layout.get_size()
+            rv = self._wide_spacing_cache[key] = 2 * self._char_width - width
+        return rv
 
-    def _get_pango_text(self, text):
-        rv = self._pango_text_cache.get(text, None)
+    def _get_hl_id(self, attrs, key=None):
+        if key is None:
+            key = _hl_key(attrs)
+        rv = self._hl_ids.get(key, None)
         if rv is None:
-            rv = GLib.markup_escape_text(text or '')
-            self._pango_text_cache[text] = rv
+            rv = len(self._hl_defs)
+            self._hl_defs.append(attrs)
+            self._hl_ids[key] = rv
         return rv
 
-    def _get_pango_attrs(self, attrs):
-        key = tuple(sorted((k, v,) for k, v in (attrs or {}).items()))
-        rv = self._pango_attrs_cache.get(key, None)
+    def _get_pango_attrs(self, hl_id):
+        # Return the Pango attributes used to draw a highlight id, for normal
+        # and cursor cells, whether the highlight is bold, its background
+        # as a cairo color and whether it is underlined. The attributes are
+        # templates which are copied for each range of a layout. Normal
+        # cells have their background filled separately, so their
+        # attributes have no background.
+        rv = self._pango_attrs_cache.get(hl_id, None)
         if rv is None:
+            attrs = self._hl_defs[hl_id] or {}
             fg = self._foreground if self._foreground != -1 else 0
             bg = self._background if self._background != -1 else 0xffffff
-            n = {
-                'foreground': _split_color(fg),
-                'background': _split_color(bg),
-            }
-            if attrs:
-                # make sure that foreground and background are assigned first
-                for k in ['foreground', 'background']:
-                    if k in attrs:
-                        n[k] = _split_color(attrs[k])
-                for k, v in attrs.items():
-                    if k == 'reverse':
-                        n['foreground'], n['background'] = \
-                            n['background'], n['foreground']
-                    elif k == 'italic':
-                        n['font_style'] = 'italic'
-                    elif k == 'bold':
-                        n['font_weight'] = 'bold'
-                        if self._bold_spacing:
-                            n['letter_spacing'] = str(self._bold_spacing)
-                    elif k == 'underline':
-                        n['underline'] = 'single'
-            c = dict(n)
-            c['foreground'] = _invert_color(*_split_color(fg))
-            c['background'] = _invert_color(*_split_color(bg))
-            c['foreground'] = _stringify_color(*c['foreground'])
-            c['background'] = _stringify_color(*c['background'])
-            n['foreground'] = _stringify_color(*n['foreground'])
-            n['background'] = _stringify_color(*n['background'])
-            n = ' '.join(['{0}="{1}"'.format(k, v) for k, v in n.items()])
-            c = ' '.join(['{0}="{1}"'.format(k, v) for k, v in c.items()])
-            rv = (n, c,)
-            self._pango_attrs_cache[key] = rv
+            n = []
+            if 'italic' in attrs:
+                n.append(Pango.attr_style_new(Pango.Style.ITALIC))
+            if 'bold' in attrs:
+                n.append(Pango.attr_weight_new(Pango.Weight.BOLD))
+                if self._bold_spacing:
+                    n.append(Pango.attr_letter_spacing_new(
+                        self._bold_spacing))
+            if 'underline' in attrs:
+                n.append(Pango.attr_underline_new(Pango.Underline.SINGLE))
+            c = list(n)
+            c.extend(_color_attrs(_invert_color(*_split_color(fg)),
+                                  _invert_color(*_split_color(bg))))
+            fg = attrs.get('foreground', fg)
+            bg = attrs.get('background', bg)
+            if 'reverse' in attrs:
+                fg, bg = bg, fg
+            n.extend(_color_attrs(_split_color(fg)))
+            rv = (n, c, 'bold' in attrs, _cairo_color(bg),
+                  'underline' in attrs,)
+            self._pango_attrs_cache[hl_id] = rv
         return rv
 
     def _reset_cache(self):
-        self._pango_text_cache = {}
         self._pango_attrs_cache = {}
+        self._wide_spacing_cache = {}
+        self._layout_cache.clear()
 
-    def _redraw_glitch_fix(self):
-        row, col = self._screen.row, self._screen.col
-        text, attrs = self._screen.get_cursor()
-        # when updating cells in italic or bold words, the result can become
-        # messy(characters can be clipped or leave remains when removed). To
-        # prevent that, always update non empty sequences of cells and the
-        # surrounding space.
-        # find the start of the sequence
-        lcol = col - 1
-        while lcol >= 0:
-            text, _ = self._screen.get_cell(row, lcol)
-            lcol -= 1
-            if text == ' ':
-                break
-        self._pending[1] = min(lcol + 1, self._pending[1])
-        # find the end of the sequence
-        rcol = col + 1
-        while rcol < self._screen.columns:
-            text, _ = self._screen.get_cell(row, rcol)
-            rcol += 1
-            if text == ' ':
-                break
-        self._pending[2] = max(rcol, self._pending[2])
+
+class _Grid(object):
+
+    """State of a nvim grid.
+
+    Each grid has its own screen and backing surface. `row`, `col`,
+    `zindex` and `order` place it in the window, grids with a higher zindex
+    or placed later are drawn on top.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.screen = None
+        self.surface = None
+        self.context = None
+        self.surface_size = (0, 0,)
+        self.pending = [0, 0, 0]
+        self.row = 0
+        self.col = 0
+        self.zindex = 0
+        self.order = 0
+        self.visible = False
+
+
+class _LRUCache(object):
+
+    """Bounded mapping that evicts the least recently used entries."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
 
 
 def _split_color(n):
@@ -588,11 +1236,36 @@ def _invert_color(r, g, b):
     return (255 - r, 255 - g, 255 - b,)
 
 
-def _stringify_color(r, g, b):
-    return '#{0:0{1}x}'.format((r << 16) + (g << 8) + b, 6)
+def _color_attrs(fg, bg=None):
+    # Pango colors have 16 bits per channel
+    fr, fg, fb = fg
+    rv = [Pango.attr_foreground_new(fr * 257, fg * 257, fb * 257)]
+    if bg:
+        br, bg, bb = bg
+        rv.append(Pango.attr_background_new(br * 257, bg * 257, bb * 257))
+    return rv
 
 
-def _stringify_key(key, state):
+def _leading_spacing(spacing):
+    # The half of the letter spacing Pango puts before a grapheme, rounded
+    # like Pango does.
+    rv = int(spacing / 2)
+    if spacing & (Pango.SCALE - 1) == 0:
+        rv = (rv + (Pango.SCALE >> 1)) & ~(Pango.SCALE - 1)
+    return rv
+
+
+def _cairo_color(n):
+    r, g, b = _split_color(n)
+    return (r / 255.0, g / 255.0, b / 255.0,)
+
+
+def _hl_key(attrs):
+    # hashable key of a highlight_set attribute dict
+    return tuple(sorted((k, v,) for k, v in (attrs or {}).items()))
+
+
+def _modifier_names(state):
     send = []
     if state & SHIFT:
         send.append('S')
@@ -600,6 +1273,11 @@ def _stringify_key(key, state):
         send.append('C')
     if state & ALT:
         send.append('A')
+    return send
+
+
+def _stringify_key(key, state):
+    send = _modifier_names(state)
     send.append(key)
     return '<' + '-'.join(send) + '>'
 
@@ -618,3 +1296,12 @@ def _parse_font(font, cr=None):
     pixels = layout.get_pixel_size()
     normal_width, _ = layout.get_size()
     return fd, pixels, normal_width, bold_width
+
+
+def _resolved_font(fd):
+    # Description of the font Pango picks for `fd`, which differs from the
+    # requested one when it falls back to another family. Stored with the
+    # cached metrics to tell which font they were measured with.
+    font_map = PangoCairo.FontMap.get_default()
+    font = font_map.load_font(font_map.create_context(), fd)
+    return font.describe().to_string() if font else None
@@ -0,0 +1,265 @@
+"""Instrumentation of startup and redraw processing."""
+import json
+import sys
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+
+__all__ = ('RedrawStats', 'LatencyTracer', 'StartupTrace')
+
+
+class Histogram(object):
+
+    """Count values in power of two buckets."""
+
+    def __init__(self):
+        """Initialize the Histogram instance."""
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, value):
+        """Add a value to the histogram."""
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        bucket = 1
+        while bucket < value:
+            bucket <<= 1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self):
+        """Get a JSON serializable summary of the histogram."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'max': self.max,
+            'buckets': dict((str(k), v)
+                            for k, v in sorted(self.buckets.items())),
+        }
+
+
+class RedrawStats(object):
+
+    """Counters and timings of redraw processing.
+
+    The UIBridge reports when notifications are received on the nvim thread
+    and how long each event handler takes, and the UI reports the frames it
+    paints. Times are measured in milliseconds. `snapshot` returns the
+    current numbers and `start_dump` periodically writes them as JSON.
+    """
+
+    def __init__(self):
+        """Initialize the RedrawStats instance."""
+        self._lock = Lock()
+        self._dump_stop = None
+        self.reset()
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self._events = {}
+            self._batch_sizes = Histogram()
+            self._queue_wait = Histogram()
+            self._latency = Histogram()
+            self._paint_time = Histogram()
+            self._batches = 0
+            self._frames = 0
+            self._coalesced = 0
+            self._paints = 0
+            self._unpainted = None
+
+    def batch_received(self, updates):
+        """Record a redraw batch received on the nvim thread.
+
+        Returns the receive time, to be passed to `batch_applied`.
+        """
+        size = 0
+        for update in updates:
+            size += len(update) - 1
+        with self._lock:
+            self._batches += 1
+            self._batch_sizes.add(size)
+        return time.time()
+
+    def batch_applied(self, received):
+        """Record that a batch received at `received` is being applied."""
+        with self._lock:
+            self._queue_wait.add((time.time() - received) * 1000)
+            if self._unpainted is None:
+                self._unpainted = received
+
+    def handler_called(self, name, nevents, elapsed):
+        """Record the time spent handling `nevents` events of type `name`."""
+        with self._lock:
+            entry = self._events.get(name)
+            if entry is None:
+                entry = self._events[name] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[1] += nevents
+            entry[2] += elapsed
+
+    def frame_drawn(self, batches):
+        """Record a frame built from `batches` redraw batches."""
+        with self._lock:
+            self._frames += 1
+            self._coalesced += batches - 1
+
+    def painted(self, started):
+        """Record a paint of the window which started at `started`."""
+        now = time.time()
+        with self._lock:
+            self._paints += 1
+            self._paint_time.add((now - started) * 1000)
+            if self._unpainted is not None:
+                self._latency.add((now - self._unpainted) * 1000)
+                self._unpainted = None
+
+    def snapshot(self):
+        """Get a JSON serializable copy of the current numbers."""
+        with self._lock:
+            events = dict((name, {'calls': calls, 'events': nevents,
+                                  'time': elapsed * 1000})
+                          for name, (calls, nevents, elapsed)
+                          in self._events.items())
+            return {
+                'events': events,
+                'batches': self._batches,
+                'batch_size': self._batch_sizes.to_dict(),
+                'queue_wait': self._queue_wait.to_dict(),
+                'frames': self._frames,
+                'coalesced_batches': self._coalesced,
+                'paints': self._paints,
+                'paint_time': self._paint_time.to_dict(),
+                'receive_to_paint': self._latency.to_dict(),
+            }
+
+    def dump(self, path):
+        """Write a snapshot to `path` as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+    def start_dump(self, path, interval=5.0):
+        """Dump a snapshot to `path` every `interval` seconds."""
+        def loop():
+            while not stop.wait(interval):
+                self.dump(path)
+        stop = self._dump_stop = Event()
+        t = Thread(target=loop)
+        t.daemon = True
+        t.start()
+
+    def stop_dump(self, path=None):
+        """Stop periodic dumps, writing a last snapshot to `path`."""
+        if self._dump_stop:
+            self._dump_stop.set()
+            self._dump_stop = None
+        if path:
+            self.dump(path)
+
+
+class LatencyTracer(object):
+
+    """Measure the latency between sending input and painting the result.
+
+    Each input sent to nvim is matched to the next redraw batch received
+    from nvim, and then to the first paint after that batch was applied.
+    The last `maxsamples` measurements are kept, in milliseconds.
+    """
+
+    def __init__(self, maxsamples=10000):
+        """Initialize the LatencyTracer instance."""
+        self._lock = Lock()
+        self._sent = []
+        self._applied = []
+        self._receive = deque(maxlen=maxsamples)
+        self._paint = deque(maxlen=maxsamples)
+
+    def input_sent(self):
+        """Record that input was sent to nvim."""
+        with self._lock:
+            self._sent.append(time.time())
+
+    def redraw_received(self):
+        """Match pending input to a redraw batch received from nvim.
+
+        Returns the send times of the matched input, to be passed to
+        `redraw_applied` when the batch is applied.
+        """
+        now = time.time()
+        with self._lock:
+            sent, self._sent = self._sent, []
+            for t in sent:
+                self._receive.append((now - t) * 1000)
+        return sent
+
+    def redraw_applied(self, sent):
+        """Record that a batch matched to input sent at `sent` was applied."""
+        if sent:
+            with self._lock:
+                self._applied.extend(sent)
+
+    def painted(self):
+        """Record a paint, completing the input of the applied batches."""
+        now = time.time()
+        with self._lock:
+            applied, self._applied = self._applied, []
+            for t in applied:
+                self._paint.append((now - t) * 1000)
+
+    def percentiles(self):
+        """Get p50/p95/p99 of the input to redraw and input to paint times."""
+        with self._lock:
+            return {
+                'input_to_redraw': _percentiles(self._receive),
+                'input_to_paint': _percentiles(self._paint),
+            }
+
+    def report(self):
+        """Get the percentiles formatted as text."""
+        lines = []
+        for name, p in sorted(self.percentiles().items()):
+            lines.append('{0}: {1} samples, p50 {2:.1f}ms, p95 {3:.1f}ms, '
+                         'p99 {4:.1f}ms'.format(name, p['count'], p['p50'],
+                                                p['p95'], p['p99']))
+        return '\n'.join(lines)
+
+
+class StartupTrace(object):
+
+    """Timestamps of the startup phases.
+
+    Each phase is written to `stream` (stderr by default) when it is
+    reached, with the milliseconds elapsed since the trace was created.
+    Phases can be marked from any thread.
+    """
+
+    def __init__(self, stream=None):
+        """Initialize the StartupTrace instance."""
+        self._lock = Lock()
+        self._start = time.time()
+        self._stream = stream or sys.stderr
+        self.phases = []
+
+    def mark(self, phase):
+        """Record that `phase` was reached."""
+        elapsed = (time.time() - self._start) * 1000
+        with self._lock:
+            self.phases.append((phase, elapsed,))
+            self._stream.write('{0:8.1f}ms {1}\n'.format(elapsed, phase))
+            self._stream.flush()
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    rv = {'count': len(samples)}
+    for p in (50, 95, 99):
+        if samples:
+            index = min(len(samples) - 1, len(samples) * p // 100)
+            rv['p{0}'.format(p)] = samples[index]
+        else:
+            rv['p{0}'.format(p)] = 0
+    return rv
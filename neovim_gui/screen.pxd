@@ -0,0 +1,41 @@
+# Static type information used when screen.py is compiled with Cython. The
+# module stays valid python, so it behaves the same when it isn't compiled.
+cimport cython
+
+
+cdef class Screen:
+    cdef readonly int columns, rows
+    cdef public int row, col, top, bot, left, right
+    cdef list _blank_text
+    cdef object _blank_attrs
+    cdef list _text, _attrs
+
+    @cython.locals(added=int, r=int, text=list)
+    cpdef resize(self, int columns, int rows)
+    cpdef clear(self)
+    cpdef eol_clear(self)
+    cpdef cursor_goto(self, int row, int col)
+    cpdef set_scroll_region(self, int top, int bot, int left, int right)
+    @cython.locals(top=int, bot=int, left=int, right=int, start=int,
+                   stop=int, step=int, row=int, rows=list, region=list)
+    cpdef scroll(self, int count)
+    @cython.locals(row=int, col=int)
+    cpdef put(self, text, int attrs)
+    @cython.locals(text=list)
+    cpdef int put_line(self, int row, int col, cells) except? -1
+    @cython.locals(end=int)
+    cpdef int put_cells(self, int row, int col, list text, attrs) except? -1
+    cpdef tuple get_cell(self, int row, int col)
+    cpdef tuple get_cursor(self)
+    @cython.locals(text=list)
+    cpdef tuple word_span(self, int row, int startcol, int endcol)
+    @cython.locals(text=list, hl=int[:], last=int, runs=list, curcol=int,
+                   col=int, attrs=int, a=int, buf=list, wide=list,
+                   length=int)
+    cpdef list _runs(self, int row, int startcol, int endcol)
+    @cython.locals(blank_text=list, rownum=int)
+    cpdef _clear_region(self, int top, int bot, int left, int right)
+
+
+@cython.locals(text=list, hl_id=int, repeat=int)
+cpdef tuple expand_cells(cells)
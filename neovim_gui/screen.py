@@ -1,37 +1,26 @@
 """Common code for graphical and text UIs."""
+from array import array
+
 from neovim.compat import IS_PYTHON3
 
 
-__all__ = ('Screen',)
+__all__ = ('Screen', 'expand_cells')
 
 
 if not IS_PYTHON3:
     range = xrange  # NOQA
 
 
-class Cell(object):
-    def __init__(self):
-        self.text = ' '
-        self.attrs = None
-
-    def __repr__(self):
-        return self.text
-
-    def get(self):
-        return self.text, self.attrs
-
-    def set(self, text, attrs):
-        self.text = text
-        self.attrs = attrs
-
-    def copy(self, other):
-        other.text = self.text
-        other.attrs = self.attrs
-
-
 class Screen(object):
 
-    """Store nvim screen state."""
+    """Store nvim screen state.
+
+    Cells are not stored as individual objects. Each row is represented by a
+    list with the text of every cell and an integer array with the highlight
+    id of every cell, so row operations are slice copies. Highlight ids are
+    opaque to the screen, the UI is responsible for mapping them to actual
+    attributes. The id 0 is used for cells with default attributes.
+    """
 
     def __init__(self, columns, rows):
         """Initialize the Screen instance."""
@@ -43,7 +32,44 @@ class Screen(object):
         self.bot = rows - 1
         self.left = 0
         self.right = columns - 1
-        self._cells = [[Cell() for c in range(columns)] for r in range(rows)]
+        self._blank_text = [' '] * columns
+        self._blank_attrs = array('i', [0]) * columns
+        self._text = [list(self._blank_text) for r in range(rows)]
+        self._attrs = [array('i', self._blank_attrs) for r in range(rows)]
+
+    def resize(self, columns, rows):
+        """Change the screen size, keeping the cells that still fit.
+
+        Cells added to the right or bottom are blank. The scroll region is
+        reset to the whole screen and the cursor is moved inside it.
+        """
+        if columns != self.columns:
+            blank_text = [' '] * columns
+            blank_attrs = array('i', [0]) * columns
+            if columns > self.columns:
+                added = columns - self.columns
+                for text in self._text:
+                    text.extend(blank_text[:added])
+                for attrs in self._attrs:
+                    attrs.extend(blank_attrs[:added])
+            else:
+                for text in self._text:
+                    del text[columns:]
+                for attrs in self._attrs:
+                    del attrs[columns:]
+            self._blank_text = blank_text
+            self._blank_attrs = blank_attrs
+        if rows > self.rows:
+            for r in range(rows - self.rows):
+                self._text.append(list(self._blank_text))
+                self._attrs.append(array('i', self._blank_attrs))
+        else:
+            del self._text[rows:]
+            del self._attrs[rows:]
+        self.columns = columns
+        self.rows = rows
+        self.set_scroll_region(0, rows - 1, 0, columns - 1)
+        self.cursor_goto(min(self.row, rows - 1), min(self.col, columns - 1))
 
     def clear(self):
         """Clear the screen."""
@@ -69,6 +95,17 @@ class Screen(object):
         """Shift scroll region."""
         top, bot = self.top, self.bot
         left, right = self.left, self.right
+        if left == 0 and right == self.columns - 1:
+            # the scroll region spans whole rows, so it is enough to rotate
+            # the row references and clear the rows that were shifted in.
+            for rows in (self._text, self._attrs):
+                region = rows[top:bot + 1]
+                rows[top:bot + 1] = region[count:] + region[:count]
+            if count > 0:
+                self._clear_region(bot - count + 1, bot, left, right)
+            else:
+                self._clear_region(top, top - count - 1, left, right)
+            return
         if count > 0:
             start = top
             stop = bot - count + 1
@@ -79,56 +116,149 @@ class Screen(object):
             step = -1
         # shift the cells
         for row in range(start, stop, step):
-            target_row = self._cells[row]
-            source_row = self._cells[row + count]
-            for col in range(left, right + 1):
-                tgt = target_row[col]
-                source_row[col].copy(tgt)
+            self._text[row][left:right + 1] = \
+                self._text[row + count][left:right + 1]
+            self._attrs[row][left:right + 1] = \
+                self._attrs[row + count][left:right + 1]
         # clear invalid cells
         for row in range(stop, stop + count, step):
             self._clear_region(row, row, left, right)
 
     def put(self, text, attrs):
-        """Put character on virtual cursor position."""
-        cell = self._cells[self.row][self.col]
-        cell.set(text, attrs)
-        self.cursor_goto(self.row, self.col + 1)
+        """Put character on virtual cursor position.
+
+        `attrs` is the integer highlight id of the character.
+        """
+        row, col = self.row, self.col
+        self._text[row][col] = text
+        self._attrs[row][col] = attrs
+        self.col = col + 1
+
+    def put_line(self, row, col, cells):
+        """Put a batch of cells received in a `grid_line` event.
+
+        Each cell is a [text, hl_id, repeat] list where hl_id and repeat are
+        optional. A missing hl_id means the one from the previous cell is
+        reused. The virtual cursor is not affected, the column after the last
+        cell is returned instead.
+        """
+        text, attrs = expand_cells(cells)
+        return self.put_cells(row, col, text, attrs)
+
+    def put_cells(self, row, col, text, attrs):
+        """Put a sequence of cells at row, col.
+
+        `text` is a list with the text of each cell and `attrs` an integer
+        array with the highlight id of each cell. The virtual cursor is not
+        affected, the column after the last cell is returned instead.
+        """
+        end = col + len(text)
+        self._text[row][col:end] = text
+        self._attrs[row][col:end] = attrs
+        return end
 
     def get_cell(self, row, col):
         """Get text, attrs at row, col."""
-        return self._cells[row][col].get()
+        return self._text[row][col], self._attrs[row][col]
 
     def get_cursor(self):
         """Get text, attrs at the virtual cursor position."""
         return self.get_cell(self.row, self.col)
 
+    def word_span(self, row, startcol, endcol):
+        """Extend the columns startcol-endcol to the surrounding spaces.
+
+        `endcol` is exclusive. The span is extended in both directions up to
+        and including the nearest space, or the edge of the screen, and the
+        new (startcol, endcol) is returned.
+        """
+        text = self._text[row]
+        if startcol > 0:
+            try:
+                startcol -= text[startcol - 1::-1].index(' ') + 1
+            except ValueError:
+                startcol = 0
+        try:
+            endcol = text.index(' ', endcol) + 1
+        except ValueError:
+            endcol = self.columns
+        return startcol, endcol
+
     def iter(self, startrow, endrow, startcol, endcol):
-        """Extract text/attrs at row, startcol-endcol."""
+        """Extract text/attrs at row, startcol-endcol.
+
+        Yields (row, col, text, attrs, wide) tuples, split where attrs
+        change. Double width characters are part of their run, and `wide`
+        has the (start, stop) offsets of their text, so they can be given
+        the width of two cells when drawn.
+        """
         for row in range(startrow, endrow + 1):
-            r = self._cells[row]
-            cell = r[startcol]
-            curcol = startcol
-            attrs = cell.attrs
-            buf = [cell.text]
-            for col in range(startcol + 1, endcol + 1):
-                cell = r[col]
-                if cell.attrs != attrs or not cell.text:
-                    yield row, curcol, ''.join(buf), attrs
-                    attrs = cell.attrs
-                    buf = [cell.text]
-                    curcol = col
-                    if not cell.text:
-                        # glyph uses two cells, yield a separate entry
-                        yield row, curcol, '', None
-                        curcol += 1
-                else:
-                    buf.append(cell.text)
-            if buf:
-                yield row, curcol, ''.join(buf), attrs
+            for col, _, text, attrs, wide in self._runs(row, startcol,
+                                                        endcol):
+                yield row, col, text, attrs, wide
+
+    def _runs(self, row, startcol, endcol):
+        # Split the cells of a row into (col, endcol, text, attrs, wide) runs
+        text = self._text[row]
+        hl = self._attrs[row]
+        last = len(text) - 1
+        runs = []
+        curcol = startcol
+        attrs = -1
+        buf = []
+        wide = []
+        length = 0
+        for col in range(startcol, endcol + 1):
+            t = text[col]
+            if not t:
+                # the cell is covered by the double width glyph before it
+                continue
+            a = hl[col]
+            if a != attrs:
+                if buf:
+                    runs.append((curcol, col, ''.join(buf), attrs,
+                                 tuple(wide),))
+                attrs = a
+                buf = []
+                wide = []
+                length = 0
+                curcol = col
+            if col < last and not text[col + 1]:
+                wide.append((length, length + len(t),))
+            buf.append(t)
+            length += len(t)
+        if buf:
+            runs.append((curcol, endcol + 1, ''.join(buf), attrs,
+                         tuple(wide),))
+        return runs
 
     def _clear_region(self, top, bot, left, right):
+        blank_text = self._blank_text[left:right + 1]
+        blank_attrs = self._blank_attrs[left:right + 1]
         for rownum in range(top, bot + 1):
-            row = self._cells[rownum]
-            for colnum in range(left, right + 1):
-                cell = row[colnum]
-                cell.set(' ', None)
+            self._text[rownum][left:right + 1] = blank_text
+            self._attrs[rownum][left:right + 1] = blank_attrs
+
+
+def expand_cells(cells):
+    """Expand the cells of a `grid_line` event.
+
+    Returns a list with the text of every cell and an integer array with the
+    highlight id of every cell, which can be passed to `Screen.put_cells`.
+    This doesn't need a screen, so it can be done before the event reaches
+    the thread that owns the screen.
+    """
+    text = []
+    attrs = array('i')
+    hl_id = 0
+    for cell in cells:
+        if len(cell) > 1:
+            hl_id = cell[1]
+        repeat = cell[2] if len(cell) > 2 else 1
+        if repeat == 1:
+            text.append(cell[0])
+            attrs.append(hl_id)
+        else:
+            text.extend([cell[0]] * repeat)
+            attrs.extend(array('i', [hl_id]) * repeat)
+    return text, attrs
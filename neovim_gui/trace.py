@@ -0,0 +1,95 @@
+"""Record notifications sent by nvim and replay them without nvim."""
+import time
+from threading import Event
+
+import msgpack
+
+
+__all__ = ('TraceRecorder', 'TraceSession', 'read_trace')
+
+
+class TraceRecorder(object):
+
+    """Write received notifications to a file.
+
+    Each notification is written as a msgpack [timestamp, method, args]
+    array, where timestamp is the number of seconds since the recorder was
+    created.
+    """
+
+    def __init__(self, path):
+        """Initialize the TraceRecorder instance."""
+        self._file = open(path, 'wb')
+        self._packer = msgpack.Packer(use_bin_type=True,
+                                      default=_pack_remote)
+        self._start = time.time()
+
+    def record(self, method, args):
+        """Append a notification to the trace."""
+        frame = [time.time() - self._start, method, args]
+        self._file.write(self._packer.pack(frame))
+
+    def close(self):
+        """Flush and close the trace file."""
+        self._file.close()
+
+
+def _pack_remote(obj):
+    # the client decodes ext types in notifications to Buffer, Window and
+    # Tabpage objects, pack them back to the ext types nvim sent
+    code_data = getattr(obj, 'code_data', None)
+    if code_data is None:
+        raise TypeError('can not serialize {0!r}'.format(obj))
+    return msgpack.ExtType(*code_data)
+
+
+def read_trace(path):
+    """Iterate over the (timestamp, method, args) entries of a trace."""
+    with open(path, 'rb') as f:
+        for timestamp, method, args in msgpack.Unpacker(f, raw=False):
+            yield timestamp, method, args
+
+
+class TraceSession(object):
+
+    """Stand-in for a nvim session which replays a recorded trace.
+
+    The notifications are delivered as fast as possible, or with the
+    recorded timing if `realtime` is true. Requests made by the UI are
+    ignored, except for `quit`, which stops the replay.
+    """
+
+    def __init__(self, path, realtime=False):
+        """Initialize the TraceSession instance."""
+        self._path = path
+        self._realtime = realtime
+        self._stopped = Event()
+        self.api = self
+
+    def run_loop(self, request_cb, notification_cb, setup_cb=None,
+                 err_cb=None):
+        """Replay the trace, returning when it ends or quit is called."""
+        if setup_cb:
+            setup_cb()
+        start = time.time()
+        for timestamp, method, args in read_trace(self._path):
+            if self._realtime:
+                delay = start + timestamp - time.time()
+                if delay > 0 and self._stopped.wait(delay):
+                    break
+            if self._stopped.is_set():
+                break
+            notification_cb(method, args)
+
+    def async_call(self, fn, *args):
+        """Call `fn` immediately."""
+        fn(*args)
+
+    def quit(self, *args):
+        """Stop the replay."""
+        self._stopped.set()
+
+    def _ignore(self, *args, **kwargs):
+        pass
+
+    input = input_mouse = ui_attach = ui_try_resize = ui_detach = _ignore
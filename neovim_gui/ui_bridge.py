@@ -1,7 +1,8 @@
 """Bridge for connecting a UI instance to nvim."""
 import sys
 import os
-from threading import Semaphore, Thread
+import time
+from threading import Lock, Semaphore, Thread
 from traceback import format_exc
 from inspect import signature
 
@@ -10,18 +11,35 @@ class UIBridge(object):
 
     """UIBridge class. Connects a Nvim instance to a UI class."""
 
-    def connect(self, nvim, ui, profile=None, notify=False):
+    # RedrawStats instance collecting redraw instrumentation, if enabled
+    stats = None
+    # LatencyTracer instance measuring input latency, if enabled
+    latency_tracer = None
+
+    def connect(self, nvim, ui, profile=None, notify=False, recorder=None,
+                stats=None, latency_tracer=None):
         """Connect nvim and the ui.
 
         This will start loops for handling the UI and nvim events while
-        also synchronizing both.
+        also synchronizing both. If `recorder` is given, every notification
+        received from nvim is passed to its `record` method. If `stats` or
+        `latency_tracer` are given, they are used to collect redraw
+        instrumentation and input latency.
         """
         self._notify = notify
+        self._recorder = recorder
+        self.stats = stats
+        self.latency_tracer = latency_tracer
         self._error = None
         self._nvim = nvim
         self._ui = ui
+        # built before the nvim event loop starts, since it is used there
+        self._build_dispatch()
         self._profile = profile
         self._sem = Semaphore(0)
+        self._input_lock = Lock()
+        self._input_queue = []
+        self._last_drag = None
         debug_env = os.environ.get("NVIM_PYTHON_UI_DEBUG", "")
         debug_ext_env = os.environ.get("NVIM_PYTHON_UI_DEBUG_EXT", "")
         self.debug_ext = len(debug_ext_env) > 0
@@ -33,10 +51,14 @@ class UIBridge(object):
         t.daemon = True
         t.start()
         self._ui_event_loop()
+        if self._recorder:
+            self._recorder.close()
         if self._error:
             print(self._error)
         if self._profile:
             print(self._profile)
+        if self.latency_tracer:
+            print(self.latency_tracer.report())
 
     def exit(self):
         """Disconnect by exiting nvim."""
@@ -44,8 +66,39 @@ class UIBridge(object):
         self._call(self._nvim.quit)
 
     def input(self, input_str):
-        """Send input to nvim."""
-        self._call(self._nvim.input, input_str)
+        """Send input to nvim.
+
+        Input queued while the nvim event loop is busy is sent in a single
+        call when it gets to it.
+        """
+        self._queue_input(input_str)
+
+    def input_drag(self, input_str):
+        """Send mouse drag input to nvim.
+
+        Drags to the position of the previous drag are dropped, and a drag
+        still queued is replaced by the new one.
+        """
+        self._queue_input(input_str, 'drag')
+
+    def input_scroll(self, input_str):
+        """Send scroll wheel input to nvim.
+
+        Consecutive queued ticks of the same input are merged into a count.
+        """
+        self._queue_input(input_str, 'scroll')
+
+    def input_mouse(self, button, action, modifier, grid, row, col):
+        """Send mouse input to nvim with `nvim_input_mouse`.
+
+        Needed when the UI is attached with `ext_multigrid`, since key codes
+        can't tell which grid the position refers to. Drags and scroll ticks
+        are coalesced like `input_drag` and `input_scroll`, and the order of
+        the mouse and key input is kept.
+        """
+        kind = ('drag' if action == 'drag' else
+                'scroll' if button == 'wheel' else None)
+        self._queue_input((button, action, modifier, grid, row, col,), kind)
 
     def resize(self, columns, rows):
         """Send a resize request to nvim."""
@@ -62,6 +115,116 @@ class UIBridge(object):
     def _call(self, fn, *args):
         self._nvim.async_call(fn, *args)
 
+    def _queue_input(self, input_str, kind=None):
+        # `input_str` is a string of keys, or a tuple with the arguments of
+        # nvim_input_mouse
+        with self._input_lock:
+            if kind == 'drag' and input_str == self._last_drag:
+                return
+            self._last_drag = input_str if kind == 'drag' else None
+            queue = self._input_queue
+            last = queue[-1] if queue else None
+            if last and last[1] == kind == 'drag':
+                last[0] = input_str
+            elif last and last[1] == kind == 'scroll' and \
+                    last[0] == input_str:
+                last[2] += 1
+            else:
+                queue.append([input_str, kind, 1])
+            if self.latency_tracer:
+                self.latency_tracer.input_sent()
+            if last:
+                # the queue was not empty, so it is already scheduled
+                return
+        self._call(self._send_input)
+
+    def _send_input(self):
+        # Called in the nvim event loop, sends all queued input at once.
+        with self._input_lock:
+            queue, self._input_queue = self._input_queue, []
+        keys = []
+        for item, _, count in queue:
+            if isinstance(item, tuple):
+                if keys:
+                    self._nvim.input(''.join(keys))
+                    keys = []
+                for _ in range(count):
+                    self._nvim.api.input_mouse(*item)
+            else:
+                keys.append(item * count)
+        if keys:
+            self._nvim.input(''.join(keys))
+
+    def _build_dispatch(self):
+        # Map each redraw event name to its bound handler and the number of
+        # arguments it accepts, so this is not computed for every update.
+        # A `_nvim_batch_<event>` method takes precedence over the
+        # `_nvim_<event>` handler and receives all argument lists of the
+        # update at once, which is stored with `None` as the arity.
+        # `_prepare_<event>` methods are collected separately, see
+        # _prepare_updates.
+        self._prepare = dict((attr[9:], getattr(self._ui, attr))
+                             for attr in dir(self._ui)
+                             if attr.startswith('_prepare_'))
+        dispatch = {}
+        for attr in dir(self._ui):
+            if attr.startswith('_nvim_batch_'):
+                dispatch[attr[12:]] = (getattr(self._ui, attr), None)
+        for attr in dir(self._ui):
+            if attr.startswith('_nvim_') and \
+               not attr.startswith('_nvim_batch_'):
+                handler = getattr(self._ui, attr)
+                nparam = len(signature(handler).parameters)
+                dispatch.setdefault(attr[6:], (handler, nparam))
+        self._dispatch = dispatch
+
+    def _prepare_updates(self, updates):
+        # Called in the nvim event loop. The argument lists of events with a
+        # `_prepare_<event>` UI method are converted by it before the update
+        # is queued, so decoding them doesn't take time from the UI thread.
+        # The method must not touch state owned by the UI thread.
+        prepare = self._prepare
+        if not prepare:
+            return updates
+        rv = []
+        for update in updates:
+            fn = prepare.get(update[0])
+            if fn is not None:
+                update = [update[0]] + fn(update[1:])
+            rv.append(update)
+        return rv
+
+    def _apply_updates(self, updates):
+        dispatch = self._dispatch
+        stats = self.stats
+        for update in updates:
+            # import sys
+            # l = [','.join([str(a) for a in args])
+            #      for args in update[1:]]
+            # print >> sys.stderr, update[0], ' '.join(l)
+            try:
+                handler, nparam = dispatch[update[0]]
+            except KeyError:
+                if self.debug_events:
+                    print(repr(update), file=sys.stdout)
+                continue
+            if self.debug_events == 2 or (
+                    self.debug_events and nparam is not None and
+                    len(update[1]) > nparam):
+                print(repr(update), file=sys.stdout)
+            if stats is not None:
+                start = time.time()
+            if nparam is None:
+                handler(update[1:])
+            else:
+                for args in update[1:]:
+                    handler(*args[:nparam])
+            if stats is not None:
+                stats.handler_called(update[0], len(update) - 1,
+                                     time.time() - start)
+        if self.debug_events == 2 or self.debug_ext:
+            print("<flush>")
+
     def _ui_event_loop(self):
         self._sem.acquire()
         if self._profile:
@@ -86,31 +249,33 @@ class UIBridge(object):
             raise Exception('Not implemented')
 
         def on_notification(method, updates):
+            if self._recorder:
+                self._recorder.record(method, updates)
+            stats = self.stats
+            if stats and method == 'redraw':
+                received = stats.batch_received(updates)
+            tracer = self.latency_tracer
+            if tracer and method == 'redraw':
+                sent = tracer.redraw_received()
+            if method == 'redraw':
+                try:
+                    updates = self._prepare_updates(updates)
+                except Exception:
+                    self._error = format_exc()
+                    self._call(self._nvim.quit)
+                    return
+
             def apply_updates():
+                if stats:
+                    stats.batch_applied(received)
+                if tracer:
+                    tracer.redraw_applied(sent)
                 if self._notify:
                     sys.stdout.write('attached\n')
                     sys.stdout.flush()
                     self._notify = False
                 try:
-                    for update in updates:
-                        # import sys
-                        # l = [','.join([str(a) for a in args])
-                        #      for args in update[1:]]
-                        # print >> sys.stderr, update[0], ' '.join(l)
-                        try:
-                            handler = getattr(self._ui, '_nvim_' + update[0])
-                            nparam = len(signature(handler).parameters)
-
-                        except AttributeError:
-                            if self.debug_events:
-                                print(repr(update), file=sys.stdout)
-                        else:
-                            if self.debug_events == 2 or (self.debug_events and len(update[1]) > nparam):
-                                print(repr(update), file=sys.stdout)
-                            for args in update[1:]:
-                                handler(*args[:nparam])
-                    if self.debug_events == 2 or self.debug_ext:
-                        print("<flush>")
+                    self._apply_updates(updates)
                 except Exception:
                     self._error = format_exc()
                     self._call(self._nvim.quit)
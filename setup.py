@@ -10,9 +10,9 @@ install_requires = [
 ]
 ext_modules = None
 
-# Cythonizing screen.py to improve scrolling/clearing speed. Maybe the
-# performance can be improved even further by writing a screen.pxd with
-# static type information
+# Cythonizing screen.py to improve scrolling/clearing speed. The static type
+# information is in screen.pxd, screen.py is used as is when Cython isn't
+# available
 try:
     from Cython.Build import cythonize
     ext_modules = cythonize('neovim_gui/screen.py')
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+from importlib.machinery import EXTENSION_SUFFIXES
+from importlib.util import module_from_spec, spec_from_file_location
+from unittest import SkipTest
+
+from bench.traces import TRACES
+
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'neovim_gui')
+
+
+def _load(name, path):
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _compile_screen(directory):
+    # build screen.py with its static types like setup.py does, but into
+    # `directory`, so it doesn't depend on an in-place build
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        raise SkipTest('Cython is not installed')
+    from setuptools import setup
+    for name in ('screen.py', 'screen.pxd'):
+        shutil.copy(os.path.join(SOURCE_DIR, name), directory)
+    setup(script_name='setup.py',
+          script_args=['-q', 'build_ext', '--build-lib', directory,
+                       '--build-temp', directory],
+          ext_modules=cythonize(os.path.join(directory, 'screen.py'),
+                                quiet=True))
+    return _load('screen', os.path.join(directory,
+                                        'screen' + EXTENSION_SUFFIXES[0]))
+
+
+def _apply_batch(screen_class, screen, batch):
+    for update in batch:
+        name = update[0]
+        for args in update[1:]:
+            if not name.startswith('grid_') or args[0] != 1:
+                continue
+            if name == 'grid_resize':
+                if screen is None:
+                    screen = screen_class(args[1], args[2])
+                else:
+                    screen.resize(args[1], args[2])
+            elif name == 'grid_line':
+                screen.put_line(args[1], args[2], args[3])
+            elif name == 'grid_scroll':
+                _, top, bot, left, right, rows, _ = args
+                screen.set_scroll_region(top, bot - 1, left, right - 1)
+                screen.scroll(rows)
+                screen.set_scroll_region(0, screen.rows - 1, 0,
+                                         screen.columns - 1)
+            elif name == 'grid_clear':
+                screen.clear()
+            elif name == 'grid_cursor_goto':
+                screen.cursor_goto(args[1], args[2])
+    return screen
+
+
+def _contents(screen):
+    return (list(screen.iter(0, screen.rows - 1, 0, screen.columns - 1)),
+            screen.get_cursor(), screen.row, screen.col)
+
+
+def test_compiled_parity():
+    directory = tempfile.mkdtemp()
+    try:
+        compiled = _compile_screen(directory).Screen
+    finally:
+        shutil.rmtree(directory)
+    pure = _load('neovim_gui._pure_screen',
+                 os.path.join(SOURCE_DIR, 'screen.py')).Screen
+    for name in sorted(TRACES):
+        a = b = None
+        for i, batch in enumerate(TRACES[name](80, 24, 20)):
+            a = _apply_batch(compiled, a, batch)
+            b = _apply_batch(pure, b, batch)
+            assert _contents(a) == _contents(b), \
+                '{0}: screens differ after batch {1}'.format(name, i)
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+from msgpack import ExtType
+
+from bench.traces import TRACES
+from neovim_gui.trace import TraceRecorder, read_trace
+
+
+def test_record_remote_objects():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'splits.trace')
+    batches = TRACES['splits'](80, 24, 3)
+    try:
+        recorder = TraceRecorder(path)
+        for batch in batches:
+            recorder.record('redraw', batch)
+        recorder.close()
+        entries = list(read_trace(path))
+    finally:
+        shutil.rmtree(directory)
+    assert [method for _, method, _ in entries] == ['redraw'] * len(batches)
+    for (_, _, recorded), batch in zip(entries, batches):
+        for update, original in zip(recorded, batch):
+            if update[0] not in ('win_pos', 'win_float_pos'):
+                continue
+            for args, original_args in zip(update[1:], original[1:]):
+                assert args[1] == ExtType(*original_args[1].code_data)
+                assert args[1].code == 1